@@ -87,7 +87,8 @@ class Boid:
             distance = self.position.distance_to(boid.position)
             if boid != self and distance < self.perception * 0.6:
                 diff = self.position - boid.position
-                diff /= distance * distance  # 距离越近，排斥力越大
+                if distance > 0:
+                    diff /= distance * distance  # 距离越近，排斥力越大
                 steering += diff
                 total += 1
         if total > 0:
@@ -0,0 +1,257 @@
+"""比较 basic / optimized / vectorized 三种引擎的基准测试
+
+每个配置都在独立的子进程中无窗口运行（两个版本的模块同名，不能在同一进程中导入），
+报告每步耗时、邻居查询耗时和峰值内存，并把结果写成 JSON 以便在 CI 中长期对比。
+optimized 为 optimized-version 的逐对象引擎，vectorized 为它的批量数组引擎。
+峰值内存在创建世界和预热时测量，计时阶段关闭 tracemalloc，不拖慢逐对象分配的引擎。
+
+用法:
+    python benchmarks/bench_engines.py --output bench.json
+    python benchmarks/bench_engines.py --sizes 100 1000 --baseline old.json
+"""
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# 引擎名 -> (所在目录, 默认允许的最大Boid数量)
+ENGINES = {
+    "basic": ("basic-version", 1000),
+    "optimized": ("optimized-version", 5000),
+    "vectorized": ("optimized-version", None),
+}
+SIZES = (100, 1000, 5000, 20000)
+# 场景名 -> (捕食者数量, 障碍物数量)
+SCENARIOS = {
+    "empty": (0, 0),
+    "hazards": (5, 10),
+}
+
+
+# --- 子进程中运行的部分 ---
+
+def _basic_world(config, rng):
+    from settings import WIDTH, HEIGHT
+    from entities.boid import Boid
+    from entities.predator import Predator
+    from entities.obstacle import Obstacle
+    from pygame.math import Vector2
+
+    boids = [Boid(rng.randint(0, WIDTH), rng.randint(0, HEIGHT)) for _ in range(config["boids"])]
+    predators = [Predator(rng.randint(0, WIDTH), rng.randint(0, HEIGHT))
+                 for _ in range(config["predators"])]
+    obstacles = [Obstacle(rng.randint(0, WIDTH), rng.randint(0, HEIGHT), rng.randint(20, 50))
+                 for _ in range(config["obstacles"])]
+
+    def step():
+        # 与 basic-version/main.py 的更新阶段相同
+        for boid in boids:
+            boid.apply_force(boid.align(boids) * 1.0)
+            boid.apply_force(boid.cohesion(boids) * 1.2)
+            boid.apply_force(boid.separation(boids) * 1.5)
+            if obstacles:
+                boid.apply_force(boid.avoid_obstacles(obstacles) * 2.0)
+            if predators:
+                flee = Vector2(0, 0)
+                for predator in predators:
+                    flee += boid.flee(predator)
+                boid.apply_force(flee * 2.5)
+            boid.update()
+        for predator in predators:
+            predator.apply_force(predator.chase(boids) * 1.5)
+            predator.update()
+
+    def query():
+        # basic 版本没有空间索引，每只Boid都要扫描全部同伴
+        for boid in boids:
+            [other for other in boids
+             if other is not boid and boid.position.distance_to(other.position) < boid.perception]
+
+    return step, query
+
+
+def _optimized_world(config, engine):
+    from simulation import Simulation
+
+    if engine == "optimized":
+        sim = Simulation(config["boids"], config["predators"], config["obstacles"],
+                         seed=config["seed"], engine="objects", grid_backend="lists")
+
+        def query():
+            # 与模拟步中相同，在 Vector2 缓存内查询
+            with sim.flock.vector_cache():
+                for boid in sim.boids:
+                    sim.grid.get_neighbors(boid, boid.perception)
+    else:
+        sim = Simulation(config["boids"], config["predators"], config["obstacles"],
+                         seed=config["seed"], engine="numpy", neighbor_backend="csr")
+
+        def query():
+            sim.flock.neighbor_pairs(sim.flock.perception)
+
+    return sim.step, query
+
+
+def run_worker(config):
+    """在当前进程中运行一个配置，返回测量结果"""
+    import random
+    import tracemalloc
+
+    engine = config["engine"]
+    os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+    sys.path.insert(0, os.path.join(ROOT, ENGINES[engine][0]))
+    import pygame.math  # 先完成导入，峰值内存只统计世界本身和模拟过程
+
+    tracemalloc.start()
+    if engine == "basic":
+        rng = random.Random(config["seed"])
+        random.seed(config["seed"])
+        step, query = _basic_world(config, rng)
+    else:
+        step, query = _optimized_world(config, engine)
+
+    for _ in range(config["warmup"]):
+        step()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    step_ms, query_ms = [], []
+    for _ in range(config["steps"]):
+        start = time.perf_counter_ns()
+        step()
+        step_ms.append((time.perf_counter_ns() - start) / 1e6)
+        start = time.perf_counter_ns()
+        query()
+        query_ms.append((time.perf_counter_ns() - start) / 1e6)
+
+    return {
+        "ms_per_step": statistics.fmean(step_ms),
+        "ms_per_step_p50": statistics.median(step_ms),
+        "ms_per_step_max": max(step_ms),
+        "neighbor_query_ms": statistics.fmean(query_ms),
+        "peak_memory_mb": peak / 2 ** 20,
+    }
+
+
+# --- 主进程部分 ---
+
+def run_config(config, timeout):
+    cmd = [sys.executable, os.path.abspath(__file__), "--worker", json.dumps(config)]
+    cwd = os.path.join(ROOT, ENGINES[config["engine"]][0])
+    proc = subprocess.run(cmd, cwd=cwd, capture_output=True, text=True, timeout=timeout)
+    if proc.returncode != 0:
+        return {"error": proc.stderr.strip().splitlines()[-1] if proc.stderr else "failed"}
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=ROOT, capture_output=True,
+                              text=True).stdout.strip() or None
+    except OSError:
+        return None
+
+
+def compare(results, baseline_path, max_regression):
+    """与基线 JSON 对比，返回超出允许回退比例的配置列表"""
+    with open(baseline_path, encoding="utf-8") as f:
+        baseline = {_key(r): r for r in json.load(f)["results"] if "ms_per_step" in r}
+    regressions = []
+    for result in results:
+        old = baseline.get(_key(result))
+        if old is None or "ms_per_step" not in result:
+            continue
+        ratio = result["ms_per_step"] / old["ms_per_step"]
+        result["baseline_ratio"] = ratio
+        if ratio > 1 + max_regression:
+            regressions.append(result)
+    return regressions
+
+
+def _key(result):
+    return result["engine"], result["boids"], result["scenario"]
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Boids engine benchmarks")
+    parser.add_argument("--engines", nargs="+", choices=tuple(ENGINES), default=list(ENGINES))
+    parser.add_argument("--sizes", nargs="+", type=int, default=list(SIZES))
+    parser.add_argument("--scenarios", nargs="+", choices=tuple(SCENARIOS), default=list(SCENARIOS))
+    parser.add_argument("--steps", type=int, default=20, help="每个配置计时的步数")
+    parser.add_argument("--warmup", type=int, default=2, help="计时前先运行的步数（同时测量峰值内存）")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--full", action="store_true",
+                        help="不跳过慢速引擎的大规模配置（basic 在 20000 只时需要数小时）")
+    parser.add_argument("--timeout", type=float, default=3600, help="单个配置的超时秒数")
+    parser.add_argument("--output", default="bench_results.json", help="结果 JSON 路径")
+    parser.add_argument("--baseline", help="用于对比的历史结果 JSON")
+    parser.add_argument("--max-regression", type=float, default=0.2,
+                        help="相对基线允许的最大变慢比例，超过则以非零状态退出")
+    parser.add_argument("--worker", help=argparse.SUPPRESS)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.worker:
+        print(json.dumps(run_worker(json.loads(args.worker))))
+        return 0
+
+    results = []
+    for engine in args.engines:
+        limit = ENGINES[engine][1]
+        for size in args.sizes:
+            for scenario in args.scenarios:
+                predators, obstacles = SCENARIOS[scenario]
+                config = {"engine": engine, "boids": size, "scenario": scenario,
+                          "predators": predators, "obstacles": obstacles,
+                          "steps": args.steps, "warmup": args.warmup, "seed": args.seed}
+                if limit is not None and size > limit and not args.full:
+                    result = dict(config, skipped=f"{engine} 超过 {limit} 只时默认跳过（--full 可强制运行）")
+                else:
+                    try:
+                        result = dict(config, **run_config(config, args.timeout))
+                    except subprocess.TimeoutExpired:
+                        result = dict(config, error="timeout")
+                results.append(result)
+                _print_result(result)
+
+    regressions = compare(results, args.baseline, args.max_regression) if args.baseline else []
+    report = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+        },
+        "results": results,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    print(f"结果已写入 {args.output}")
+
+    for result in regressions:
+        print(f"性能回退: {result['engine']} {result['boids']} {result['scenario']} "
+              f"x{result['baseline_ratio']:.2f}")
+    return 1 if regressions else 0
+
+
+def _print_result(result):
+    name = f"{result['engine']:>10} {result['boids']:>6} {result['scenario']:<8}"
+    if "ms_per_step" in result:
+        print(f"{name} {result['ms_per_step']:10.2f} ms/step  "
+              f"query {result['neighbor_query_ms']:9.2f} ms  "
+              f"peak {result['peak_memory_mb']:8.1f} MB")
+    else:
+        print(f"{name} {result.get('skipped') or result.get('error')}")
+
+
+if __name__ == "__main__":
+    sys.exit(main())
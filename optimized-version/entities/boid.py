@@ -1,29 +1,99 @@
 import pygame
 import math
-import random
 from pygame.math import Vector2
 from settings import *
+from utils import wrap_delta
+
+# FSM状态，数组中以其下标存储
+STATES = ("FLOCKING", "FLEEING")
 
 class Boid:
-    def __init__(self, x, y):
-        self.position = Vector2(x, y)
-        self.velocity = Vector2(random.uniform(-1, 1), random.uniform(-1, 1)).normalize() * random.uniform(2, 4)
-        self.acceleration = Vector2()
+    """FlockArrays 中一只Boid的视图，所有运动状态都读写自鸟群数组"""
+    def __init__(self, flock, index):
+        self.flock = flock
+        self.index = index
         
         # Boid属性
-        self.max_speed = BOID_DEFAULTS["max_speed"]
-        self.max_force = BOID_DEFAULTS["max_force"]
-        self.perception = BOID_DEFAULTS["perception"]
-        self.size = BOID_DEFAULTS["size"]
-        self.fov_angle = BOID_FOV_ANGLE
+        self.max_speed = flock.max_speed
+        self.max_force = flock.max_force
+        self.perception = flock.perception
+        self.size = flock.size
+        self.fov_angle = flock.fov_angle
         
-        # 状态与可视化
-        self.state = "FLOCKING" # FSM: FLOCKING, FLEEING
-        self.is_leader = False
-        self.leader_target = Vector2(random.randint(0, WIDTH), random.randint(0, HEIGHT))
+        # 可视化
         self.color = BOID_COLOR
-        self.trail = []
-        self.max_trail = BOID_DEFAULTS["max_trail"]
+        self.max_trail = flock.max_trail
+
+    # 位置和速度在逐对象引擎的一步内从 flock.vector_cache 的缓存复制，其余时候从数组行读取
+    @property
+    def position(self):
+        vectors = self.flock._vectors
+        if vectors is not None:
+            return Vector2(vectors[0][self.index])
+        return Vector2(self.flock.pos[self.index].tolist())
+
+    @position.setter
+    def position(self, value):
+        flock = self.flock
+        flock.pos[self.index] = value
+        flock._index_current = False
+        if flock._vectors is not None:
+            flock._vectors[0][self.index] = Vector2(value)
+
+    @property
+    def velocity(self):
+        vectors = self.flock._vectors
+        if vectors is not None:
+            return Vector2(vectors[1][self.index])
+        return Vector2(self.flock.vel[self.index].tolist())
+
+    @velocity.setter
+    def velocity(self, value):
+        flock = self.flock
+        flock.vel[self.index] = value
+        if flock._vectors is not None:
+            flock._vectors[1][self.index] = Vector2(value)
+
+    @property
+    def acceleration(self):
+        return Vector2(self.flock.acc[self.index].tolist())
+
+    @acceleration.setter
+    def acceleration(self, value):
+        self.flock.acc[self.index] = value
+
+    @property
+    def state(self):
+        return STATES[self.flock.state[self.index]]
+
+    @state.setter
+    def state(self, value):
+        self.flock.state[self.index] = STATES.index(value)
+
+    @property
+    def is_leader(self):
+        return bool(self.flock.is_leader[self.index])
+
+    @is_leader.setter
+    def is_leader(self, value):
+        self.flock.is_leader[self.index] = value
+
+    @property
+    def leader_target(self):
+        return Vector2(self.flock.leader_target[self.index].tolist())
+
+    @leader_target.setter
+    def leader_target(self, value):
+        self.flock.leader_target[self.index] = value
+
+    @property
+    def trail(self):
+        flock = self.flock
+        length = flock.trail_len[self.index]
+        if length == 0:
+            return []
+        points = flock.trail[self.index, flock.trail_order()[flock.max_trail - length:]]
+        return [Vector2(*p) for p in points]
 
     def apply_behaviors(self, neighbors, predators, obstacles, params):
         """根据环境和状态计算并应用所有行为力"""
@@ -32,15 +102,18 @@ class Boid:
         total_force = Vector2()
         
         if self.state == "FLEEING":
-            flee_force = self.flee_from_predators(predators) * FLEE_WEIGHT_MULTIPLIER
-            sep_force = self.separation(neighbors) * SEPARATION_THREAT_MULTIPLIER
+            flee_force = self.flee_from_predators(predators) * self.flock.flee_weight
+            sep_force = self.separation(neighbors) * self.flock.threat_separation_weight
             total_force += flee_force + sep_force
         
         elif self.state == "FLOCKING":
             if self.is_leader:
                 # 领导者有一种漫游行为
-                if self.position.distance_to(self.leader_target) < 100 or random.random() < 0.01:
-                    self.leader_target = Vector2(random.randint(0, WIDTH), random.randint(0, HEIGHT))
+                rng = self.flock.rng
+                if (self.position.distance_to(self.leader_target) < 100
+                        or rng.random() < 0.01 * self.flock.step_scale):
+                    self.leader_target = Vector2(rng.randint(0, self.flock.width),
+                                                 rng.randint(0, self.flock.height))
                 total_force += self.seek(self.leader_target) * 0.5
             
             align_force = self.align(neighbors) * params["align_weight"]
@@ -57,30 +130,37 @@ class Boid:
         """有限状态机：根据威胁更新Boid状态"""
         if predators:
             closest_predator_dist = min(self.position.distance_to(p.position) for p in predators)
-            if closest_predator_dist < THREAT_AWARENESS_RADIUS:
+            if closest_predator_dist < self.flock.threat_radius:
                 self.state = "FLEEING"
                 return
         self.state = "FLOCKING"
 
     def update(self):
-        self.trail.append(self.position.copy())
-        if len(self.trail) > self.max_trail:
-            self.trail.pop(0)
+        # 只写入当前槽位，整群更新完后由调用方统一推进 trail_head
+        self.flock._push_trail(slice(self.index, self.index + 1))
             
-        self.velocity += self.acceleration
-        self.velocity.scale_to_length(min(self.max_speed, self.velocity.length()))
-        self.position += self.velocity
+        # velocity 属性返回副本，限速后需写回数组
+        scale = self.flock.step_scale
+        velocity = self.velocity + self.acceleration * scale
+        velocity.scale_to_length(min(self.max_speed, velocity.length()))
+        self.velocity = velocity
+        self.position += velocity * scale
         self.acceleration *= 0
         self._wrap_around()
 
     def apply_force(self, force):
         self.acceleration += force
 
+    def _offset_to(self, other_pos):
+        """环形世界中从自身指向另一位置的最短位移"""
+        to_other = other_pos - self.position
+        return Vector2(wrap_delta(to_other.x, self.flock.width), wrap_delta(to_other.y, self.flock.height))
+
     def _in_view(self, other_pos):
         """检查另一个位置是否在Boid的视野内"""
-        to_other = other_pos - self.position
+        to_other = self._offset_to(other_pos)
         if to_other.length_squared() == 0: return False
-        angle = self.velocity.angle_to(to_other)
+        angle = (self.velocity.angle_to(to_other) + 180) % 360 - 180
         return abs(angle) < self.fov_angle / 2
 
     def seek(self, target):
@@ -108,25 +188,25 @@ class Boid:
         return steering
 
     def cohesion(self, neighbors):
-        center_of_mass = Vector2()
+        offset = Vector2()
         count = 0
         for other in neighbors:
             if self._in_view(other.position):
-                center_of_mass += other.position
+                offset += self._offset_to(other.position)
                 count += 1
         if count > 0:
-            center_of_mass /= count
-            return self.seek(center_of_mass)
+            offset /= count
+            return self.seek(self.position + offset)
         return Vector2()
 
     def separation(self, neighbors):
         steering = Vector2()
         count = 0
         for other in neighbors:
-            dist = self.position.distance_to(other.position)
+            diff = -self._offset_to(other.position)
+            dist = diff.length()
             # 即使不在视野内也要避开太近的同伴
             if dist < self.perception * 0.6: 
-                diff = self.position - other.position
                 if dist > 0:
                     diff /= (dist * dist) # 距离越近，力越大
                 steering += diff
@@ -144,7 +224,9 @@ class Boid:
     def avoid_obstacles(self, obstacles):
         """预测性避障"""
         steering = Vector2()
-        future_pos = self.position + self.velocity * PREDICTION_FACTOR * FPS * 0.1
+        flock = self.flock
+        future_pos = (self.position
+                      + self.velocity * flock.step_scale * flock.lookahead * flock.tick_rate * 0.1)
         for obs in obstacles:
             dist_to_future = future_pos.distance_to(obs.position)
             if dist_to_future < obs.radius + self.size * 5:
@@ -161,7 +243,7 @@ class Boid:
         steering = Vector2()
         for predator in predators:
             dist = self.position.distance_to(predator.position)
-            if dist < THREAT_AWARENESS_RADIUS:
+            if dist < self.flock.threat_radius:
                 steering += self.position - predator.position
         if steering.length() > 0:
             steering.normalize_ip()
@@ -172,10 +254,10 @@ class Boid:
         return steering
 
     def _wrap_around(self):
-        if self.position.x < -self.size: self.position.x = WIDTH + self.size
-        if self.position.x > WIDTH + self.size: self.position.x = -self.size
-        if self.position.y < -self.size: self.position.y = HEIGHT + self.size
-        if self.position.y > HEIGHT + self.size: self.position.y = -self.size
+        flock = self.flock
+        flock._wrap_around(slice(self.index, self.index + 1))
+        if flock._vectors is not None:
+            flock._vectors[0][self.index] = Vector2(flock.pos[self.index].tolist())
 
     def draw(self, screen):
         # 轨迹
@@ -5,14 +5,19 @@ from pygame.math import Vector2
 from settings import *
 
 class Predator:
-    def __init__(self, x, y):
+    def __init__(self, x, y, rng=random, defaults=PREDATOR_DEFAULTS, width=WIDTH, height=HEIGHT,
+                 tick_rate=SIM_TICK_RATE):
         self.position = Vector2(x, y)
-        self.velocity = Vector2(random.uniform(-1, 1), random.uniform(-1, 1)).normalize() * 2.5
+        self.velocity = Vector2(rng.uniform(-1, 1), rng.uniform(-1, 1)).normalize() * 2.5
         self.acceleration = Vector2()
-        self.max_speed = PREDATOR_DEFAULTS["max_speed"]
-        self.max_force = PREDATOR_DEFAULTS["max_force"]
-        self.perception = PREDATOR_DEFAULTS["perception"]
-        self.size = PREDATOR_DEFAULTS["size"]
+        self.max_speed = defaults["max_speed"]
+        self.max_force = defaults["max_force"]
+        self.perception = defaults["perception"]
+        self.size = defaults["size"]
+        self.width = width
+        self.height = height
+        # 与 FlockArrays.step_scale 相同：每步积分的 SIM_TICK_RATE 步数
+        self.step_scale = SIM_TICK_RATE / tick_rate
         self.color = PREDATOR_COLOR
 
     def apply_behaviors(self, boids):
@@ -20,11 +25,16 @@ class Predator:
         chase_force = self.chase(boids)
         self.apply_force(chase_force * 1.5)
 
+    def pursue(self, target):
+        """追逐已经选定的目标位置（None 表示没有目标）"""
+        if target is not None:
+            self.apply_force(self.seek(Vector2(*target)) * 1.5)
+
     def update(self):
-        self.velocity += self.acceleration
+        self.velocity += self.acceleration * self.step_scale
         if self.velocity.length() > self.max_speed:
             self.velocity.scale_to_length(self.max_speed)
-        self.position += self.velocity
+        self.position += self.velocity * self.step_scale
         self.acceleration *= 0
         self._bounce_off_walls()
 
@@ -59,15 +69,15 @@ class Predator:
         if self.position.x < margin:
             self.velocity.x *= -1
             self.position.x = margin
-        elif self.position.x > WIDTH - margin:
+        elif self.position.x > self.width - margin:
             self.velocity.x *= -1
-            self.position.x = WIDTH - margin
+            self.position.x = self.width - margin
         if self.position.y < margin:
             self.velocity.y *= -1
             self.position.y = margin
-        elif self.position.y > HEIGHT - margin:
+        elif self.position.y > self.height - margin:
             self.velocity.y *= -1
-            self.position.y = HEIGHT - margin
+            self.position.y = self.height - margin
 
     def draw(self, screen):
         angle = self.velocity.angle_to(Vector2(1, 0))
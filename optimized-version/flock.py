@@ -0,0 +1,478 @@
+import random
+import time
+from contextlib import contextmanager
+import numpy as np
+from pygame.math import Vector2
+from settings import *
+from entities.boid import Boid, STATES
+from neighbors import CellGrid, create_index
+from obstacle_field import ObstacleField
+import kernels
+
+FLOCKING = STATES.index("FLOCKING")
+FLEEING = STATES.index("FLEEING")
+
+
+def _lengths(vecs):
+    return np.sqrt(np.einsum("ij,ij->i", vecs, vecs))
+
+
+def _limit(vecs, max_len):
+    """就地把长度超过 max_len 的向量缩放到 max_len"""
+    lengths = _lengths(vecs)
+    over = lengths > max_len
+    vecs[over] *= (max_len / lengths[over])[:, None]
+    return vecs
+
+
+def _set_length(vecs, length):
+    """就地把非零向量缩放到指定长度（零向量保持不变）"""
+    lengths = _lengths(vecs)
+    nonzero = lengths > 0
+    vecs[nonzero] *= (length / lengths[nonzero])[:, None]
+    return vecs
+
+
+def lerp_positions(prev, pos, alpha, max_jump):
+    """按 alpha 在两步的位置之间插值；一步内移动超过 max_jump 的（环绕边界或被拖动）直接取当前位置"""
+    result = prev + (pos - prev) * alpha
+    jumped = np.abs(pos - prev).max(axis=1, initial=0) > max_jump
+    result[jumped] = pos[jumped]
+    return result
+
+
+def predator_array(predators):
+    """捕食者位置打包为 (k, 2) 数组"""
+    return np.array([(p.position.x, p.position.y) for p in predators], dtype=float).reshape(-1, 2)
+
+
+def obstacle_array(obstacles):
+    """障碍物打包为 (k, 3) 数组，每行为 (x, y, radius)"""
+    return np.array([(o.position.x, o.position.y, o.radius) for o in obstacles],
+                    dtype=float).reshape(-1, 3)
+
+
+def obstacle_field(obstacles):
+    """Obstacle 列表转换为 ObstacleField，已经是 ObstacleField 时原样返回"""
+    if isinstance(obstacles, ObstacleField):
+        return obstacles
+    return ObstacleField(obstacle_array(obstacles))
+
+
+class FlockArrays:
+    """结构数组(SoA)形式的鸟群引擎
+
+    位置、速度、加速度、状态和领导者标记都保存在连续的 NumPy 数组中，
+    三条 Reynolds 规则、视野判断以及速度限制/环绕都以批量数组运算完成。
+    self.boids 中的 Boid 对象只是指向数组某一行的轻量视图。
+    """
+
+    def __init__(self, capacity=256, backend=NEIGHBOR_BACKEND, kernel=FLOCK_KERNEL, rng=random,
+                 width=WIDTH, height=HEIGHT, defaults=BOID_DEFAULTS, tick_rate=SIM_TICK_RATE):
+        capacity = max(1, capacity)
+        # 世界大小和Boid参数在创建时确定，之后的计算只读实例属性
+        self.width = width
+        self.height = height
+        # 随机数来源，默认使用全局 random 模块；传入 random.Random 实例可复现
+        self.rng = rng
+        self.n = 0
+        self.pos = np.zeros((capacity, 2))
+        # 上一步的位置，用于在两步之间插值绘制
+        self.prev_pos = np.zeros((capacity, 2))
+        self.vel = np.zeros((capacity, 2))
+        self.acc = np.zeros((capacity, 2))
+        self.state = np.zeros(capacity, dtype=np.int8)
+        self.is_leader = np.zeros(capacity, dtype=bool)
+        self.leader_target = np.zeros((capacity, 2))
+        # 每只Boid远离所有威胁它的捕食者的位移之和，由 prepare 计算
+        self.threat = np.zeros((capacity, 2))
+        # 每只Boid最近一次计算的行为力，LOD 调度跳过的Boid沿用它
+        self.steering = np.zeros((capacity, 2))
+
+        self.max_speed = defaults["max_speed"]
+        self.max_force = defaults["max_force"]
+        self.perception = defaults["perception"]
+        self.size = defaults["size"]
+        self.fov_angle = defaults["fov_angle"]
+        self.threat_radius = defaults["threat_radius"]
+        self.flee_weight = defaults["flee_weight"]
+        self.threat_separation_weight = defaults["threat_separation_weight"]
+        # 预测性避障的前瞻时间（秒）
+        self.lookahead = defaults["lookahead"]
+        # 每秒步数。速度和力以 SIM_TICK_RATE 下的一步为单位，每步积分 step_scale 个单位，
+        # 提高步频只让模拟更细，运动快慢不变
+        self.tick_rate = tick_rate
+        self.step_scale = SIM_TICK_RATE / tick_rate
+        # 并行引擎的工作进程按同样的参数创建鸟群外壳
+        self.defaults = dict(defaults)
+        # 轨迹环形缓冲区：所有Boid共用写入位置 trail_head，
+        # trail_len 为每只Boid已记录的点数；长度为 0 时不占用内存
+        self.max_trail = defaults["max_trail"]
+        self.trail = np.zeros((capacity, self.max_trail, 2))
+        self.trail_len = np.zeros(capacity, dtype=np.int32)
+        self.trail_head = 0
+
+        self.boids = []
+        # 邻居索引，每步按当前位置重建
+        self.index = create_index(backend, width, height, self.perception)
+        # 索引是否已按当前位置构建（同一步中威胁查询和邻居配对共用一次构建）
+        self._index_current = False
+        # 逐对象引擎一步内的 (位置, 速度) Vector2 列表，见 vector_cache
+        self._vectors = None
+        # 规则力的计算方式："numpy" 或 "numba"（不可用时回退到 numpy）
+        self.kernel = kernel if kernel != "numba" or kernels.AVAILABLE else "numpy"
+        if self.kernel == "numba":
+            kernels.warmup()
+            self._kernel_grid = CellGrid(width, height, self.perception)
+
+    @classmethod
+    def random(cls, count, width=WIDTH, height=HEIGHT, backend=NEIGHBOR_BACKEND,
+               kernel=FLOCK_KERNEL, rng=random, defaults=BOID_DEFAULTS, tick_rate=SIM_TICK_RATE):
+        """在世界范围内随机生成 count 只Boid"""
+        flock = cls(capacity=count, backend=backend, kernel=kernel, rng=rng,
+                    width=width, height=height, defaults=defaults, tick_rate=tick_rate)
+        for _ in range(count):
+            flock.add(rng.randint(0, width), rng.randint(0, height))
+        return flock
+
+    def __len__(self):
+        return self.n
+
+    def _grow(self, capacity):
+        for name in ("pos", "prev_pos", "vel", "acc", "state", "is_leader", "leader_target", "threat",
+                     "steering", "trail", "trail_len"):
+            old = getattr(self, name)
+            new = np.zeros((capacity,) + old.shape[1:], dtype=old.dtype)
+            new[:self.n] = old[:self.n]
+            setattr(self, name, new)
+
+    def add(self, x, y):
+        """添加一只Boid并返回它的视图"""
+        if self.n == len(self.pos):
+            self._grow(max(1, 2 * len(self.pos)))
+        i = self.n
+        self.n += 1
+        self.pos[i] = (x, y)
+        self.prev_pos[i] = (x, y)
+        rng = self.rng
+        direction = np.array((rng.uniform(-1, 1), rng.uniform(-1, 1)))
+        self.vel[i] = direction / np.hypot(*direction) * rng.uniform(2, 4)
+        self.acc[i] = 0
+        self.steering[i] = 0
+        self.state[i] = FLOCKING
+        self.is_leader[i] = False
+        self.leader_target[i] = (rng.randint(0, self.width), rng.randint(0, self.height))
+        self.trail_len[i] = 0
+        self._index_current = False
+        boid = Boid(self, i)
+        self.boids.append(boid)
+        return boid
+
+    @contextmanager
+    def vector_cache(self):
+        """逐对象引擎的一步内把位置和速度缓存为 Vector2
+
+        Boid 视图读取位置和速度时从缓存复制，不必每次从数组行新建；
+        缓存期间只能通过 Boid 的属性修改位置和速度，Boid 写数组时同时更新缓存。
+        """
+        n = self.n
+        self._vectors = ([Vector2(p) for p in self.pos[:n].tolist()],
+                         [Vector2(v) for v in self.vel[:n].tolist()])
+        try:
+            yield
+        finally:
+            self._vectors = None
+
+    # --- 邻居查找 ---
+
+    def neighbor_pairs(self, radius):
+        """返回所有距离小于 radius 的有序邻居对 (i, j, d, d2)
+
+        d 为从 i 指向 j 的环形位移，d2 为距离平方。
+        """
+        self._build_index()
+        return self.index.neighbor_pairs(radius)
+
+    def nearest(self, points, radius, k=1, periodic=True):
+        """每个查询点半径内最近的 k 只Boid，返回 (indices, d2)，见 NeighborIndex.nearest"""
+        self._build_index()
+        return self.index.nearest(points, radius, k, periodic)
+
+    def predator_targets(self, predator_pos, radius, claim=False):
+        """每个捕食者要追逐的Boid下标，感知范围内没有Boid时为 -1
+
+        捕食者在边界反弹而不环绕，因此按直线距离挑选最近的Boid。claim 为 True 时
+        离猎物最近的捕食者先认领，其余捕食者改追自己最近的未被认领的Boid。
+        """
+        m = len(predator_pos)
+        if m == 0 or self.n == 0:
+            return np.full(m, -1, dtype=np.intp)
+        k = min(m, self.n) if claim else 1
+        indices, d2 = self.nearest(predator_pos, radius, k, periodic=False)
+        if not claim:
+            return indices[:, 0]
+        targets = np.full(m, -1, dtype=np.intp)
+        claimed = set()
+        for p in np.argsort(d2[:, 0], kind="stable").tolist():
+            for j in indices[p].tolist():
+                if j < 0:
+                    break
+                if j not in claimed:
+                    claimed.add(j)
+                    targets[p] = j
+                    break
+        return targets
+
+    def _build_index(self):
+        if not self._index_current:
+            self.index.build(self.pos[:self.n])
+            self._index_current = True
+
+    # --- 行为 ---
+
+    def apply_behaviors(self, predators, obstacles, params, lod=None):
+        """对所有Boid批量计算并累加行为力（等价于逐个调用 Boid.apply_behaviors）
+
+        obstacles 可以是 Obstacle 列表，也可以是已经建好的 ObstacleField。
+        传入 LODScheduler 时只为它选出的Boid重新计算，其余沿用上一次的行为力。
+        """
+        n = self.n
+        if n == 0:
+            return
+        predator_pos = predator_array(predators)
+        self.prepare(predator_pos)
+        rows = np.arange(n) if lod is None else lod.select(self, predator_pos)
+        start = time.perf_counter()
+        if len(rows) < n:
+            self._build_index()
+            q, j, d, d2 = self.index.query_pairs(self.pos[rows], self.perception)
+            keep = j != rows[q]
+            self.steering[rows] = self.steering_forces(rows, q[keep], j[keep], d[keep], d2[keep],
+                                                       obstacle_field(obstacles), params)
+        else:
+            if self.kernel == "numba":
+                self._kernel_grid.build(self.pos[:n])
+                rules = kernels.reynolds_forces(self._kernel_grid, self.vel[:n], self.perception,
+                                                self.fov_angle, self.max_speed, self.max_force)
+            else:
+                i, j, d, d2 = self.neighbor_pairs(self.perception)
+                rules = self.rule_forces(self.vel[:n], i, j, d, d2)
+            self.steering[:n] = self.combine_forces(rows, *rules, obstacle_field(obstacles), params)
+        if lod is not None:
+            lod.record(time.perf_counter() - start, len(rows), n)
+        self.acc[:n] += self.steering[:n]
+
+    def prepare(self, predator_pos):
+        """计算力之前的串行部分：更新状态机并为领导者挑选新的漫游目标"""
+        n = self.n
+        state = self.state[:n]
+        state[:] = FLOCKING
+        threat = self.threat[:n]
+        threat[:] = 0
+        if len(predator_pos) and n:
+            j, away = self.threat_pairs(predator_pos)
+            state[j] = FLEEING
+            threat[:, 0] = np.bincount(j, weights=away[:, 0], minlength=n)
+            threat[:, 1] = np.bincount(j, weights=away[:, 1], minlength=n)
+
+        for k in np.flatnonzero(self.is_leader[:n] & (state == FLOCKING)):
+            offset = self.leader_target[k] - self.pos[k]
+            if np.hypot(*offset) < 100 or self.rng.random() < 0.01 * self.step_scale:
+                self.leader_target[k] = (self.rng.randint(0, self.width),
+                                         self.rng.randint(0, self.height))
+
+    def threat_pairs(self, predator_pos):
+        """用邻居索引查出每个捕食者威胁范围内的Boid
+
+        返回 (j, away)：j 为受威胁的Boid下标，away 为从捕食者指向它的位移，
+        按捕食者顺序排列，使逐Boid累加的顺序与逐个捕食者循环一致。
+        离所有捕食者都很远的Boid不会出现在结果中。
+        """
+        self._build_index()
+        q, j, _, _ = self.index.query_pairs(predator_pos, self.threat_radius)
+        # 索引按环形距离查找，而威胁按直线距离判断（与逐对象版本一致），环形结果是其超集
+        away = self.pos[j] - predator_pos[q]
+        keep = np.einsum("ij,ij->i", away, away) < self.threat_radius ** 2
+        order = np.argsort(q[keep], kind="stable")
+        return j[keep][order], away[keep][order]
+
+    def steering_forces(self, rows, i, j, d, d2, obstacles, params):
+        """计算 rows 中各Boid的行为合力
+
+        i 为配对中目标Boid在 rows 内的局部下标，j 为邻居的全局下标。
+        每行的结果只取决于该行的配对及其顺序，因此按任意方式划分 rows
+        分别计算都与整体计算逐位一致。
+        """
+        rules = self.rule_forces(self.vel[rows], i, j, d, d2)
+        return self.combine_forces(rows, *rules, obstacles, params)
+
+    def rule_forces(self, vel, i, j, d, d2):
+        """由邻居配对计算三条 Reynolds 规则力 (align, cohesion, separation)"""
+        separation = self._separation(vel, i, d, d2)
+        in_view = self._in_view(vel, i, d, d2)
+        iv, jv, dv = i[in_view], j[in_view], d[in_view]
+        return self._align(vel, iv, jv), self._cohesion(vel, iv, dv), separation
+
+    def combine_forces(self, rows, align, cohesion, separation, obstacles, params):
+        """按状态机加权合成规则力，并加上逃离、领导者漫游和避障"""
+        m = len(rows)
+        pos = self.pos[rows]
+        vel = self.vel[rows]
+        fleeing = self.state[rows] == FLEEING
+        flocking = ~fleeing
+
+        total = np.zeros((m, 2))
+        if fleeing.any():
+            # 只为逃跑中的Boid计算逃离力
+            flee = self._flee(self.threat[rows][fleeing], vel[fleeing])
+            total[fleeing] += (flee * self.flee_weight
+                               + separation[fleeing] * self.threat_separation_weight)
+        if flocking.any():
+            total[flocking] += (align * params["align_weight"]
+                                + cohesion * params["cohesion_weight"]
+                                + separation * params["separation_weight"])[flocking]
+            # 领导者的漫游行为
+            leaders = self.is_leader[rows] & flocking
+            if leaders.any():
+                seek = self._steer(vel, self.leader_target[rows] - pos, leaders)
+                total[leaders] += seek[leaders] * 0.5
+
+        if len(obstacles):
+            total += self._avoid_obstacles(pos, vel, obstacles) * 2.0
+        return total
+
+    def _in_view(self, vel, i, d, d2):
+        """视野判断：速度方向与指向邻居的方向夹角小于 fov/2"""
+        v = vel[i]
+        dot = np.einsum("ij,ij->i", v, d)
+        limit = np.cos(np.radians(self.fov_angle / 2)) * _lengths(v) * np.sqrt(d2)
+        return (d2 > 0) & (dot > limit)
+
+    def _steer(self, vel, desired, mask):
+        """desired 归一化到最大速度后减去当前速度，并限制在 max_force 内"""
+        steering = np.zeros_like(vel)
+        steering[mask] = _set_length(desired[mask], self.max_speed) - vel[mask]
+        return _limit(steering, self.max_force)
+
+    def _mean(self, i, values, m):
+        """按目标下标对配对上的向量求平均，返回 (平均值, 是否有配对)"""
+        count = np.bincount(i, minlength=m)
+        # 没有配对时 bincount 返回整数数组，先分配浮点数组再填入
+        total = np.zeros((m, 2))
+        total[:, 0] = np.bincount(i, values[:, 0], m)
+        total[:, 1] = np.bincount(i, values[:, 1], m)
+        has = count > 0
+        total[has] /= count[has, None]
+        return total, has
+
+    def _align(self, vel, i, j):
+        average, has = self._mean(i, self.vel[j], len(vel))
+        return self._steer(vel, average, has)
+
+    def _cohesion(self, vel, i, d):
+        # 质心相对自身的偏移即为期望方向
+        offset, has = self._mean(i, d, len(vel))
+        return self._steer(vel, offset, has)
+
+    def _separation(self, vel, i, d, d2):
+        close = d2 < (self.perception * 0.6) ** 2
+        i, d, d2 = i[close], d[close], d2[close]
+        # 距离越近，力越大；重合的同伴只计数不产生力
+        safe = np.where(d2 > 0, d2, 1.0)
+        average, has = self._mean(i, -d / safe[:, None], len(vel))
+        return self._steer(vel, average, has)
+
+    def _flee(self, total, vel):
+        """total 为远离各个威胁捕食者的位移之和"""
+        has = _lengths(total) > 0
+        steering = np.zeros_like(vel)
+        steering[has] = _set_length(total[has], self.max_speed) - vel[has]
+        # 逃跑时力更大
+        lengths = _lengths(steering)
+        over = lengths > self.max_force
+        steering[over] *= (self.max_force * 2 / lengths[over])[:, None]
+        return steering
+
+    def _avoid_obstacles(self, pos, vel, obstacles):
+        """预测性避障，obstacles 为 ObstacleField，只检查预测位置所在单元格的候选障碍物"""
+        # 一步的位移乘以前瞻时间内的步数
+        future = pos + vel * self.step_scale * self.lookahead * self.tick_rate * 0.1
+        q, k = obstacles.candidates(future)
+        center = obstacles.data[k, :2]
+        radius = obstacles.data[k, 2]
+        dist_to_future = _lengths(future[q] - center)
+        near = dist_to_future < radius + self.size * 5
+        q, center, radius, dist_to_future = q[near], center[near], radius[near], dist_to_future[near]
+        away = _set_length(pos[q] - center, 1.0)
+        strength = 1 - dist_to_future / (radius + self.perception)
+        # 每只Boid的候选按障碍物顺序排列，累加顺序与逐个障碍物循环相同
+        steering = np.zeros_like(pos)
+        for axis in (0, 1):
+            steering[:, axis] = np.bincount(q, weights=away[:, axis] * strength, minlength=len(pos))
+        return _limit(steering, self.max_force)
+
+    # --- 积分 ---
+
+    def update(self):
+        """记录轨迹、积分速度和位置、限速并环绕边界"""
+        n = self.n
+        self._push_trail(slice(0, n))
+        self._advance_trail()
+        vel = self.vel[:n]
+        vel += self.acc[:n] * self.step_scale
+        _limit(vel, self.max_speed)
+        self.pos[:n] += vel * self.step_scale
+        self.acc[:n] = 0
+        self._wrap_around(slice(0, n))
+
+    def _push_trail(self, rows):
+        """把当前位置写入环形缓冲区的当前槽位，所有Boid写完后调用 _advance_trail"""
+        if self.max_trail == 0:
+            return
+        self.trail[rows, self.trail_head] = self.pos[rows]
+        length = self.trail_len[rows]
+        self.trail_len[rows] = np.minimum(length + 1, self.max_trail)
+
+    def _advance_trail(self):
+        if self.max_trail:
+            self.trail_head = (self.trail_head + 1) % self.max_trail
+
+    def trail_order(self):
+        """环形缓冲区中从旧到新的槽位下标"""
+        return (self.trail_head + np.arange(self.max_trail)) % self.max_trail
+
+    def ordered_trails(self):
+        """返回 (n, max_trail, 2) 从旧到新排列的轨迹，每行只有最后 trail_len 个点有效"""
+        return self.trail[:self.n][:, self.trail_order()]
+
+    def set_trail_length(self, length):
+        """运行时修改轨迹长度，保留每只Boid最近的轨迹点；0 表示关闭并释放内存"""
+        length = max(0, int(length))
+        if length == self.max_trail:
+            return
+        keep = min(length, self.max_trail)
+        trail = np.zeros((len(self.pos), length, 2))
+        if keep:
+            trail[:self.n, :keep] = self.ordered_trails()[:, self.max_trail - keep:]
+        self.trail = trail
+        self.trail_len = np.minimum(self.trail_len, keep).astype(np.int32)
+        self.max_trail = length
+        self.trail_head = keep % length if length else 0
+        for boid in self.boids:
+            boid.max_trail = length
+
+    def interpolated_positions(self, alpha):
+        """上一步与当前步之间按 alpha 插值的位置，跨越边界环绕的Boid直接取当前位置"""
+        return lerp_positions(self.prev_pos[:self.n], self.pos[:self.n], alpha,
+                              self.max_speed * self.step_scale * 2)
+
+    def _wrap_around(self, rows):
+        pos = self.pos[rows]
+        size = self.size
+        for axis, extent in ((0, self.width), (1, self.height)):
+            coord = pos[..., axis]
+            coord[coord < -size] = extent + size
+            coord[coord > extent + size] = -size
+        self.pos[rows] = pos
+        # 位置已变化，下次查询前需要重建索引
+        self._index_current = False
@@ -0,0 +1,140 @@
+import math
+import numpy as np
+
+try:
+    from numba import njit, prange
+except ImportError:
+    njit = None
+    prange = range
+
+# 是否可以使用 Numba 编译的内核
+AVAILABLE = njit is not None
+
+
+def _steer(sx, sy, vx, vy, max_speed, max_force):
+    """(sx, sy) 归一化到最大速度后减去当前速度，并限制在 max_force 内"""
+    length = math.sqrt(sx * sx + sy * sy)
+    if length > 0:
+        sx *= max_speed / length
+        sy *= max_speed / length
+    sx -= vx
+    sy -= vy
+    length = math.sqrt(sx * sx + sy * sy)
+    if length > max_force:
+        sx *= max_force / length
+        sy *= max_force / length
+    return sx, sy
+
+
+def _wrap(delta, extent):
+    return delta - extent * np.round(delta / extent)
+
+
+def _reynolds_forces(pos, vel, order, cell_start, cell_count, grid_w, grid_h,
+                     cell_w, cell_h, width, height, perception, cos_half_fov,
+                     max_speed, max_force, out):
+    """对每只Boid遍历周围 3x3 个单元格，计算对齐、聚合、分离三个力
+
+    out 的形状为 (n, 3, 2)，依次存放 align、cohesion、separation。
+    单元格边长不小于 perception，所以 3x3 个单元格足以覆盖感知范围。
+    """
+    n = pos.shape[0]
+    r2 = perception * perception
+    sep_r2 = (perception * 0.6) ** 2
+    for i in prange(n):
+        px = pos[i, 0]
+        py = pos[i, 1]
+        vx = vel[i, 0]
+        vy = vel[i, 1]
+        speed = math.sqrt(vx * vx + vy * vy)
+        cx = int((px % width) // cell_w) % grid_w
+        cy = int((py % height) // cell_h) % grid_h
+        # 网格小于 3 格时直接遍历整行/整列，避免同一单元格被计入两次
+        x_lo, x_span = (0, grid_w) if grid_w < 3 else (cx - 1, 3)
+        y_lo, y_span = (0, grid_h) if grid_h < 3 else (cy - 1, 3)
+
+        ax = ay = 0.0
+        ox = oy = 0.0
+        view_count = 0
+        sx = sy = 0.0
+        sep_count = 0
+        for ky in range(y_span):
+            ny = (y_lo + ky) % grid_h
+            for kx in range(x_span):
+                cell = ny * grid_w + (x_lo + kx) % grid_w
+                start = cell_start[cell]
+                for k in range(start, start + cell_count[cell]):
+                    j = order[k]
+                    if j == i:
+                        continue
+                    dx = _wrap(pos[j, 0] - px, width)
+                    dy = _wrap(pos[j, 1] - py, height)
+                    d2 = dx * dx + dy * dy
+                    if d2 >= r2:
+                        continue
+                    if d2 < sep_r2:
+                        # 距离越近，力越大；重合的同伴只计数不产生力
+                        if d2 > 0:
+                            sx -= dx / d2
+                            sy -= dy / d2
+                        sep_count += 1
+                    if d2 > 0 and vx * dx + vy * dy > cos_half_fov * speed * math.sqrt(d2):
+                        ax += vel[j, 0]
+                        ay += vel[j, 1]
+                        ox += dx
+                        oy += dy
+                        view_count += 1
+
+        for rule in range(3):
+            out[i, rule, 0] = 0.0
+            out[i, rule, 1] = 0.0
+        if view_count > 0:
+            out[i, 0, 0], out[i, 0, 1] = _steer(ax / view_count, ay / view_count,
+                                                vx, vy, max_speed, max_force)
+            # 质心相对自身的偏移即为期望方向
+            out[i, 1, 0], out[i, 1, 1] = _steer(ox / view_count, oy / view_count,
+                                                vx, vy, max_speed, max_force)
+        if sep_count > 0:
+            out[i, 2, 0], out[i, 2, 1] = _steer(sx / sep_count, sy / sep_count,
+                                                vx, vy, max_speed, max_force)
+
+
+if AVAILABLE:
+    # cache=True 把编译结果写入 __pycache__，之后启动直接加载
+    _steer = njit(cache=True, inline="always")(_steer)
+    _wrap = njit(cache=True, inline="always")(_wrap)
+    _reynolds_forces = njit(parallel=True, cache=True)(_reynolds_forces)
+
+
+def reynolds_forces(grid, vel, perception, fov_angle, max_speed, max_force):
+    """一次调用算出所有Boid的三条规则力，返回 (align, cohesion, separation)
+
+    grid 为已用Boid位置构建好的 CellGrid，其单元格边长不小于 perception。
+    """
+    pos = grid.positions
+    out = np.empty((len(pos), 3, 2))
+    _reynolds_forces(pos, np.ascontiguousarray(vel), grid.order, grid.cell_start,
+                     grid.cell_count, grid.grid_width, grid.grid_height,
+                     grid.cell_width, grid.cell_height, float(grid.width), float(grid.height),
+                     float(perception), math.cos(math.radians(fov_angle / 2)),
+                     float(max_speed), float(max_force), out)
+    return out[:, 0], out[:, 1], out[:, 2]
+
+
+_warmed_up = False
+
+
+def warmup():
+    """用很小的输入触发一次编译（或从磁盘缓存加载），避免第一帧卡顿"""
+    global _warmed_up
+    if not AVAILABLE:
+        return False
+    if _warmed_up:
+        return True
+    from neighbors import CellGrid
+    grid = CellGrid(200, 200, 70)
+    rng = np.random.default_rng(0)
+    grid.build(rng.uniform(0, 200, (8, 2)))
+    reynolds_forces(grid, rng.uniform(-1, 1, (8, 2)), 70, 140, 4.5, 0.2)
+    _warmed_up = True
+    return True
@@ -0,0 +1,51 @@
+import math
+import numpy as np
+from settings import *
+from entities.boid import STATES
+
+FLEEING = STATES.index("FLEEING")
+
+
+class LODScheduler:
+    """按时间预算轮流更新部分Boid的行为力
+
+    每步只为 1/interval 的Boid重新计算行为力（按下标轮转，interval 步内每只都会
+    轮到一次），其余Boid沿用上一次的行为力积分。逃跑中的Boid、捕食者附近的Boid
+    和领导者每步都更新。interval 根据实测耗时自动调整：用每步耗时折算出全部
+    更新所需的时间，取使其不超过 target_ms 的最小间隔。
+    """
+
+    def __init__(self, target_ms=LOD_TARGET_MS, max_interval=LOD_MAX_INTERVAL,
+                 predator_radius=LOD_PREDATOR_RADIUS):
+        self.target_ms = target_ms
+        self.max_interval = max(1, max_interval)
+        self.predator_radius = predator_radius
+        self.interval = 1
+        self.phase = 0
+        # 全部Boid都更新时一步的预计耗时（毫秒），指数滑动平均
+        self.full_ms = None
+        # 上一步实际更新的Boid数
+        self.updated = 0
+
+    def select(self, flock, predator_pos):
+        """返回本步需要重新计算行为力的Boid下标（升序），需在 flock.prepare 之后调用"""
+        n = flock.n
+        self.phase = (self.phase + 1) % self.interval
+        due = (np.arange(n) + self.phase) % self.interval == 0
+        due |= flock.state[:n] == FLEEING
+        due |= flock.is_leader[:n]
+        if len(predator_pos):
+            _, near, _, _ = flock.index.query_pairs(predator_pos, self.predator_radius)
+            due[near] = True
+        rows = np.flatnonzero(due)
+        self.updated = len(rows)
+        return rows
+
+    def record(self, seconds, updated, total):
+        """记录一步的耗时，并据此调整更新间隔"""
+        if updated == 0 or total == 0:
+            return
+        full_ms = seconds * 1000 * total / updated
+        self.full_ms = full_ms if self.full_ms is None else 0.8 * self.full_ms + 0.2 * full_ms
+        interval = math.ceil(self.full_ms / self.target_ms) if self.target_ms > 0 else 1
+        self.interval = min(max(1, interval), self.max_interval)
@@ -1,129 +1,191 @@
+import argparse
 import pygame
-import random
 import sys
+import time
 from pygame.locals import *
 from settings import *
-from entities.boid import Boid
-from entities.predator import Predator
-from entities.obstacle import Obstacle
-from utils import init_fonts, draw_text, draw_stats, SpatialGrid, draw_grid, draw_force_field
-from pygame.math import Vector2
+from profiler import FrameProfiler
+from renderer import BoidRenderer
+from replay import replay_main
+from sim_worker import SimulationWorker, WorkerError
+from scenario import Scenario, ScenarioError, create_simulation, load_scenario
+from timestep import FixedTimestep, FRAME_SKIP_POLICIES
+from utils import (init_fonts, draw_text, draw_stats, draw_grid, draw_force_field,
+                   draw_profiler, VelocityField)
 
-def main():
-    # 初始化Pygame
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Optimized Reynolds Boids Model")
+    parser.add_argument("--replay", metavar="DIR", help="回放 run.py --record 录制的轨迹目录")
+    parser.add_argument("--scenario", metavar="FILE", help="场景文件 (.toml/.json)")
+    parser.add_argument("--fps", type=int, default=FPS, help="绘制帧率上限")
+    parser.add_argument("--tick-rate", type=int,
+                        help=f"模拟每秒的步数（默认取场景中的值，{SIM_TICK_RATE}）；"
+                             "只改变每步积分的时间，不改变运动快慢")
+    parser.add_argument("--frame-skip", choices=FRAME_SKIP_POLICIES, default=FRAME_SKIP_POLICY,
+                        help="一帧内追赶不及时的处理方式")
+    parser.add_argument("--lod-ms", type=float,
+                        help="行为力计算的每步时间预算（毫秒），0 表示每步更新全部Boid")
+    parser.add_argument("--worker", action="store_true",
+                        help="在独立进程中运行模拟，绘制不被耗时的模拟步阻塞")
+    return parser.parse_args(argv)
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.replay:
+        replay_main(args.replay)
+        return
+    try:
+        scenario = load_scenario(args.scenario) if args.scenario else Scenario()
+        if args.lod_ms is not None:
+            scenario = scenario.replace(lod_ms=args.lod_ms)
+        if args.tick_rate is not None:
+            scenario = scenario.replace(tick_rate=args.tick_rate)
+    except ScenarioError as e:
+        sys.exit(f"场景错误: {e}")
+    
+    # 初始化Pygame，窗口大小与场景的世界大小一致
     pygame.init()
-    screen = pygame.display.set_mode((WIDTH, HEIGHT))
+    screen = pygame.display.set_mode((scenario.width, scenario.height))
     pygame.display.set_caption("Optimized Reynolds Boids Model")
     
     # 初始化字体
     font, title_font = init_fonts()
     
-    # 创建实体和空间分区网格
-    boids = [Boid(random.randint(0, WIDTH), random.randint(0, HEIGHT)) 
-             for _ in range(INITIAL_BOIDS)]
-    predators = []
-    obstacles = []
-    grid = SpatialGrid(WIDTH, HEIGHT, GRID_CELL_SIZE)
-
-    # 模拟参数
-    sim_params = {
-        "align_weight": ALIGN_WEIGHT,
-        "cohesion_weight": COHESION_WEIGHT,
-        "separation_weight": SEPARATION_WEIGHT,
-    }
+    # 创建模拟世界（实体、空间分区网格和模拟参数）
+    if args.worker:
+        sim = SimulationWorker(scenario, policy=args.frame_skip)
+    else:
+        sim = create_simulation(scenario)
     
-    # 高亮Boid作为领导者
-    highlighted_boid = random.choice(boids)
-    highlighted_boid.is_leader = True
+    # 按阶段记录每帧耗时
+    profiler = FrameProfiler()
+    sim.profiler = profiler
+    
+    # 批量绘制鸟群和捕食者
+    renderer = BoidRenderer()
+    # 力场可视化使用的速度场，缓存若干帧
+    force_field = VelocityField(scenario.width, scenario.height)
     
     # 主循环控制
     clock = pygame.time.Clock()
+    # 模拟按固定步长推进，绘制时在最近两步之间插值
+    timestep = FixedTimestep(scenario.tick_rate, policy=args.frame_skip)
+    last_time = time.perf_counter()
     paused = False
     debug_grid = False
     debug_forces = False
+    show_profiler = False
     
     while True:
+        frame_start = time.perf_counter_ns()
+        now = time.perf_counter()
+        elapsed = now - last_time
+        last_time = now
         for event in pygame.event.get():
             if event.type == QUIT:
+                sim.close()
                 pygame.quit()
                 sys.exit()
             elif event.type == KEYDOWN:
                 if event.key == K_SPACE:
                     paused = not paused
-                elif event.key == K_r:  # 重置模拟
-                    boids = [Boid(random.randint(0, WIDTH), random.randint(0, HEIGHT)) 
-                            for _ in range(INITIAL_BOIDS)]
-                    predators = []
-                    obstacles = []
-                    highlighted_boid = random.choice(boids)
-                    highlighted_boid.is_leader = True
+                    if args.worker:
+                        sim.pause(paused)
+                elif event.key == K_r:  # 按场景重新开始
+                    sim.restart()
                 elif event.key == K_g: # 切换网格可视化
                     debug_grid = not debug_grid
                 elif event.key == K_f: # 切换力场可视化
                     debug_forces = not debug_forces
+                    force_field.invalidate()
+                elif event.key == K_t: # 开关轨迹，关闭时释放轨迹内存
+                    # 打开时使用场景的轨迹长度，场景关闭了轨迹时用默认长度
+                    sim.flock.set_trail_length(
+                        0 if sim.flock.max_trail else scenario.boid.max_trail or BOID_DEFAULTS["max_trail"])
+                elif event.key == K_LEFTBRACKET: # 缩短/加长轨迹
+                    sim.flock.set_trail_length(sim.flock.max_trail - 5)
+                elif event.key == K_RIGHTBRACKET:
+                    sim.flock.set_trail_length(sim.flock.max_trail + 5)
+                elif event.key in (K_F5, K_F9): # 保存/读取快照，失败（例如还没有保存过）时只报告
+                    try:
+                        if event.key == K_F5:
+                            sim.save_snapshot()
+                        else:
+                            sim.load_snapshot()
+                            force_field.invalidate()
+                    except (OSError, ValueError) as e:
+                        print(f"快照失败: {e}", file=sys.stderr)
+                elif event.key == K_v: # 切换精灵/像素绘制模式
+                    renderer.toggle_mode()
+                elif event.key == K_p: # 切换性能面板
+                    show_profiler = not show_profiler
+                elif event.key == K_o: # 导出各阶段耗时
+                    stamp = time.strftime("%Y%m%d-%H%M%S")
+                    profiler.dump_csv(f"profile_{stamp}.csv")
+                    profiler.dump_chrome_trace(f"profile_{stamp}.trace.json")
                 # 动态参数调整
                 elif event.key == K_UP:
-                    sim_params["separation_weight"] += 0.1
+                    sim.set_param("separation_weight", sim.sim_params["separation_weight"] + 0.1)
                 elif event.key == K_DOWN:
-                    sim_params["separation_weight"] -= 0.1
+                    sim.set_param("separation_weight", sim.sim_params["separation_weight"] - 0.1)
                 elif event.key == K_RIGHT:
-                    sim_params["cohesion_weight"] += 0.1
+                    sim.set_param("cohesion_weight", sim.sim_params["cohesion_weight"] + 0.1)
                 elif event.key == K_LEFT:
-                    sim_params["cohesion_weight"] -= 0.1
+                    sim.set_param("cohesion_weight", sim.sim_params["cohesion_weight"] - 0.1)
                 elif event.key == K_ESCAPE:
+                    sim.close()
                     pygame.quit()
                     sys.exit()
             elif event.type == MOUSEBUTTONDOWN:
                 if event.button == 1:  # 左键添加障碍物
-                    obstacles.append(Obstacle(event.pos[0], event.pos[1], random.randint(20, 50)))
+                    sim.add_obstacle(event.pos[0], event.pos[1])
                 elif event.button == 3:  # 右键添加捕食者
-                    predators.append(Predator(event.pos[0], event.pos[1]))
+                    sim.add_predator(event.pos[0], event.pos[1])
 
-        if not paused:
-            # --- 更新阶段 ---
-            
-            # 1. 将Boids放入空间网格以优化邻居查找
-            grid.clear()
-            for boid in boids:
-                grid.add(boid)
-
-            # 2. 更新Boids
-            for boid in boids:
-                # 从网格获取近邻，避免O(n^2)计算
-                neighbors = grid.get_neighbors(boid, boid.perception)
-                boid.apply_behaviors(neighbors, predators, obstacles, sim_params)
-                boid.update()
-
-            # 3. 更新捕食者
-            for predator in predators:
-                # 从网格获取Boid目标
-                nearby_boids = grid.get_neighbors(predator, predator.perception)
-                predator.apply_behaviors(nearby_boids)
-                predator.update()
+        # --- 更新阶段 ---
+        if args.worker:
+            # 模拟在工作进程中按自己的节奏运行，这里只取最新的完整帧
+            try:
+                sim.poll()
+            except WorkerError as e:
+                sim.close()
+                pygame.quit()
+                sys.exit(str(e))
+            positions = predator_positions = None
+        else:
+            if not paused:
+                sim.step(timestep.advance(elapsed))
+            alpha = 1.0 if paused else timestep.alpha
+            positions, predator_positions = sim.interpolated(alpha)
 
         # --- 绘制阶段 ---
         screen.fill(BACKGROUND)
         
         # 可选的可视化
-        if debug_grid:
-            draw_grid(screen, grid)
-        if debug_forces:
-            draw_force_field(screen, boids)
-        
-        for obstacle in obstacles:
-            obstacle.draw(screen)
+        with profiler.phase("debug"):
+            if debug_grid:
+                draw_grid(screen, sim.grid)
+            if debug_forces:
+                draw_force_field(screen, force_field, sim.flock)
         
-        for predator in predators:
-            predator.draw(screen)
+        with profiler.phase("entities"):
+            for obstacle in sim.obstacles:
+                obstacle.draw(screen)
             
-        for boid in boids:
-            boid.draw(screen)
+            renderer.draw(screen, sim.flock, sim.predators, positions, predator_positions)
         
-        draw_text(screen, font, title_font)
-        draw_stats(screen, font, boids, predators, obstacles, paused, sim_params)
+        with profiler.phase("hud"):
+            draw_text(screen, font, title_font)
+            draw_stats(screen, font, sim.boids, sim.predators, sim.obstacles, paused, sim.sim_params)
+            if show_profiler:
+                draw_profiler(screen, font, profiler)
 
-        pygame.display.flip()
-        clock.tick(FPS)
+        with profiler.phase("flip"):
+            pygame.display.flip()
+        # 整帧耗时不含 clock.tick 的等待时间
+        profiler.record("frame", frame_start, time.perf_counter_ns() - frame_start)
+        profiler.end_frame()
+        clock.tick(args.fps)
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,474 @@
+import math
+import numpy as np
+from settings import AUTO_SKEW_THRESHOLD
+
+try:
+    from scipy.spatial import cKDTree
+except ImportError:
+    cKDTree = None
+
+
+def wrap(delta, extent):
+    """环形世界中的最短坐标差（数组版本的 utils.wrap_delta）"""
+    return delta - extent * np.round(delta / extent)
+
+
+def _empty_pairs():
+    return (np.empty(0, dtype=np.intp), np.empty(0, dtype=np.intp),
+            np.empty((0, 2)), np.empty(0))
+
+
+def _merge_nearest(best_j, best_d2, rows, q, j, d2):
+    """把新候选 (q, j, d2) 并入 rows 行已有的前 k 近结果（按距离，相同距离先到先得）"""
+    k = best_j.shape[1]
+    all_q = np.concatenate([np.repeat(np.arange(len(rows)), k), q])
+    all_j = np.concatenate([best_j[rows].ravel(), j])
+    all_d2 = np.concatenate([best_d2[rows].ravel(), d2])
+    order = np.lexsort((all_d2, all_q))
+    all_q, all_j, all_d2 = all_q[order], all_j[order], all_d2[order]
+    rank = np.arange(len(all_q)) - np.searchsorted(all_q, all_q)
+    top = rank < k
+    best_j[rows[all_q[top]], rank[top]] = all_j[top]
+    best_d2[rows[all_q[top]], rank[top]] = all_d2[top]
+
+
+class NeighborIndex:
+    """邻居索引的公共接口
+
+    子类实现 build(positions) 和 query_pairs(points, radius, exclude_self)，
+    这里在其基础上提供与 SpatialGrid 相同的实体接口以及批量查询的派生形式。
+    """
+
+    def clear(self):
+        self.entities = []
+        self.positions = np.empty((0, 2))
+        self.migrations = 0
+        self._dirty = False
+
+    def build(self, positions):
+        raise NotImplementedError
+
+    def query_pairs(self, points, radius, exclude_self=False):
+        """批量查询：返回扁平数组 (q, j, d, d2)
+
+        q 为查询点下标，j 为索引中实体的下标，d 为从查询点指向实体的环形位移，
+        d2 为距离平方，只保留 d2 < radius**2 的结果。exclude_self 为 True 时
+        查询点即索引自身的实体，会去掉 q == j 的配对。
+        """
+        raise NotImplementedError
+
+    def occupancy_skew(self):
+        """实体分布的不均匀程度，1 表示完全均匀"""
+        return 1.0
+
+    # --- 与 SpatialGrid 相同的实体接口 ---
+
+    def add(self, entity):
+        self.entities.append(entity)
+        self._dirty = True
+
+    def update_all(self, entities, positions=None):
+        """以当前位置重建索引，返回与上一帧相比的单元格迁移次数"""
+        self.entities = list(entities)
+        if positions is None:
+            positions = [(e.position.x, e.position.y) for e in self.entities]
+        self.build(positions)
+        return self.migrations
+
+    def _ensure_built(self):
+        if self._dirty:
+            self.build([(e.position.x, e.position.y) for e in self.entities])
+
+    def get_neighbors(self, entity, radius):
+        self._ensure_built()
+        point = np.array([[entity.position.x, entity.position.y]])
+        _, j, _, _ = self.query_pairs(point, radius)
+        entities = self.entities
+        return [entities[k] for k in j if entities[k] is not entity]
+
+    # --- 批量查询的派生形式 ---
+
+    def neighbor_pairs(self, radius):
+        """索引中所有实体两两之间距离小于 radius 的有序配对 (i, j, d, d2)"""
+        self._ensure_built()
+        return self.query_pairs(self.positions, radius, exclude_self=True)
+
+    def nearest(self, points, radius, k=1, periodic=True):
+        """每个查询点半径内最近的 k 个实体，返回形状为 (m, k) 的 (indices, d2)
+
+        按距离从近到远排列，不足 k 个时 indices 为 -1、d2 为 inf。
+        periodic 为 False 时按直线距离（不环绕）计算，例如会在边界反弹的捕食者。
+        """
+        self._ensure_built()
+        points = np.asarray(points, dtype=float).reshape(-1, 2)
+        best_j = np.full((len(points), k), -1, dtype=np.intp)
+        best_d2 = np.full((len(points), k), np.inf)
+        q, j, d, d2 = self.query_pairs(points, radius)
+        if not periodic:
+            d2 = self._straight_d2(points, q, j, radius)
+        keep = d2 < radius * radius
+        _merge_nearest(best_j, best_d2, np.arange(len(points)), q[keep], j[keep], d2[keep])
+        return best_j, best_d2
+
+    def _straight_d2(self, points, q, j, radius):
+        # 直线距离不小于环形距离，环形查询的结果是直线距离查询的超集
+        d = self.positions[j] - points[q]
+        return np.einsum("ij,ij->i", d, d)
+
+    def query_radius(self, points, radius):
+        """以 CSR 形式返回每个查询点半径内的实体下标 (offsets, indices)"""
+        q, j, _, _ = self.query_pairs(points, radius)
+        order = np.argsort(q, kind="stable")
+        counts = np.bincount(q, minlength=len(np.asarray(points).reshape(-1, 2)))
+        offsets = np.concatenate([[0], np.cumsum(counts)])
+        return offsets, j[order]
+
+
+class CellGrid(NeighborIndex):
+    """按单元格排序的空间网格（CSR 布局），用于批量邻居查询
+
+    每次构建时用计数排序把实体下标按单元格分桶：order 中
+    [cell_start[c], cell_start[c] + cell_count[c]) 区间即为单元格 c 中的实体。
+    与 SpatialGrid 一样把世界视为环形。
+    """
+
+    def __init__(self, width, height, cell_size):
+        self.width = width
+        self.height = height
+        self.cell_size = cell_size
+        self.grid_width = max(1, int(width // cell_size))
+        self.grid_height = max(1, int(height // cell_size))
+        # 单元格均分整个世界，边长不小于 cell_size
+        self.cell_width = width / self.grid_width
+        self.cell_height = height / self.grid_height
+        self.clear()
+
+    def clear(self):
+        super().clear()
+        self.cell = np.empty(0, dtype=np.intp)
+        self.order = np.empty(0, dtype=np.intp)
+        self.cell_count = np.zeros(self.grid_width * self.grid_height, dtype=np.intp)
+        self.cell_start = np.zeros_like(self.cell_count)
+
+    def _cell_coords(self, points):
+        cx = ((points[:, 0] % self.width) // self.cell_width).astype(np.intp) % self.grid_width
+        cy = ((points[:, 1] % self.height) // self.cell_height).astype(np.intp) % self.grid_height
+        return cx, cy
+
+    def build(self, positions):
+        """对一批坐标做计数排序，生成 CSR 结构"""
+        positions = np.asarray(positions, dtype=float).reshape(-1, 2)
+        cx, cy = self._cell_coords(positions)
+        cell = cy * self.grid_width + cx
+        n_cells = self.grid_width * self.grid_height
+        if len(cell) == len(self.cell):
+            self.migrations = int(np.count_nonzero(cell != self.cell))
+        else:
+            self.migrations = len(cell)
+        # 16 位整数键的稳定排序由 NumPy 以基数（计数）排序实现
+        keys = cell.astype(np.uint16) if n_cells <= 1 << 16 else cell
+        self.order = np.argsort(keys, kind="stable")
+        self.cell_count = np.bincount(cell, minlength=n_cells)
+        self.cell_start = np.cumsum(self.cell_count) - self.cell_count
+        self.positions = positions
+        self.cell = cell
+        self._dirty = False
+
+    def occupancy_skew(self):
+        """最满单元格的实体数与非空单元格平均实体数之比"""
+        occupied = self.cell_count[self.cell_count > 0]
+        if len(occupied) == 0:
+            return 1.0
+        return float(occupied.max() / occupied.mean())
+
+    # --- 批量查询 ---
+
+    def _axis_offsets(self, radius, size, count):
+        rings = math.ceil(radius / size)
+        if 2 * rings + 1 >= count:
+            # 查询范围覆盖整行/整列，改用不重复的单元格集合
+            return list(range(count)), False
+        return list(range(-rings, rings + 1)), True
+
+    def _ring_offsets(self, ring):
+        """第 ring 圈上的单元格偏移（去掉网格较小时环绕造成的重复）"""
+        def axis(r, count):
+            low = (count - 1) // 2
+            return range(-min(r, low), min(r, count - 1 - low) + 1)
+
+        xs, ys = axis(ring, self.grid_width), axis(ring, self.grid_height)
+        inner_x, inner_y = axis(ring - 1, self.grid_width), axis(ring - 1, self.grid_height)
+        return [(ox, oy) for oy in ys for ox in xs
+                if ring == 0 or not (ox in inner_x and oy in inner_y)]
+
+    def nearest(self, points, radius, k=1, periodic=True):
+        """从查询点所在单元格开始一圈一圈向外搜索最近的 k 个实体
+
+        第 k 近的距离不超过尚未搜索的单元格可能的最小距离时，该查询点提前结束。
+        """
+        self._ensure_built()
+        points = np.asarray(points, dtype=float).reshape(-1, 2)
+        m = len(points)
+        best_j = np.full((m, k), -1, dtype=np.intp)
+        best_d2 = np.full((m, k), np.inf)
+        if m == 0 or len(self.positions) == 0:
+            return best_j, best_d2
+        gw, gh = self.grid_width, self.grid_height
+        cw, ch = self.cell_width, self.cell_height
+        cx, cy = self._cell_coords(points)
+        fx = np.clip((points[:, 0] % self.width) - cx * cw, 0, cw)
+        fy = np.clip((points[:, 1] % self.height) - cy * ch, 0, ch)
+        # 查询点到自身单元格边界的最短距离
+        edge = np.minimum(np.minimum(fx, cw - fx), np.minimum(fy, ch - fy))
+        r2 = radius * radius
+        px, py = self.positions[:, 0], self.positions[:, 1]
+        active = np.arange(m)
+        ring = 0
+        while len(active):
+            offsets = self._ring_offsets(ring)
+            if not offsets:
+                break
+            qs, js, d2s = [], [], []
+            for ox, oy in offsets:
+                other = (cy[active] + oy) % gh * gw + (cx[active] + ox) % gw
+                c = self.cell_count[other]
+                total = int(c.sum())
+                if total == 0:
+                    continue
+                base = np.repeat(self.cell_start[other] - (np.cumsum(c) - c), c)
+                q = np.repeat(np.arange(len(active)), c)
+                j = self.order[np.arange(total) + base]
+                dx = px[j] - points[active[q], 0]
+                dy = py[j] - points[active[q], 1]
+                if periodic:
+                    dx = wrap(dx, self.width)
+                    dy = wrap(dy, self.height)
+                d2 = dx * dx + dy * dy
+                keep = d2 < r2
+                qs.append(q[keep])
+                js.append(j[keep])
+                d2s.append(d2[keep])
+            if qs:
+                _merge_nearest(best_j, best_d2, active, np.concatenate(qs),
+                               np.concatenate(js), np.concatenate(d2s))
+            # 下一圈单元格与查询点的距离至少为 bound
+            bound = edge[active] + ring * min(cw, ch)
+            done = (bound >= radius) | (best_d2[active, k - 1] <= bound * bound)
+            active = active[~done]
+            ring += 1
+        return best_j, best_d2
+
+    def query_pairs(self, points, radius, exclude_self=False):
+        self._ensure_built()
+        points = np.asarray(points, dtype=float).reshape(-1, 2)
+        if len(points) == 0 or len(self.positions) == 0:
+            return _empty_pairs()
+        gw, gh = self.grid_width, self.grid_height
+        cw, ch = self.cell_width, self.cell_height
+        cx, cy = self._cell_coords(points)
+        # 查询点在所在单元格中的偏移，用于按单元格最小距离剔除
+        fx = np.clip((points[:, 0] % self.width) - cx * cw, 0, cw)
+        fy = np.clip((points[:, 1] % self.height) - cy * ch, 0, ch)
+        x_offsets, x_relative = self._axis_offsets(radius, cw, gw)
+        y_offsets, y_relative = self._axis_offsets(radius, ch, gh)
+        r2 = radius * radius
+        px, py = self.positions[:, 0], self.positions[:, 1]
+        qx, qy = points[:, 0], points[:, 1]
+        rows = np.arange(len(points))
+
+        qs, js, dxs, dys = [], [], [], []
+        for oy in y_offsets:
+            if y_relative:
+                ny = (cy + oy) % gh
+                gap_y = np.where(oy > 0, (oy - 1) * ch + (ch - fy),
+                                 np.where(oy < 0, (-oy - 1) * ch + fy, 0.0))
+            else:
+                ny = np.full(len(points), oy)
+                gap_y = np.zeros(len(points))
+            for ox in x_offsets:
+                if x_relative:
+                    nx = (cx + ox) % gw
+                    gap_x = np.where(ox > 0, (ox - 1) * cw + (cw - fx),
+                                     np.where(ox < 0, (-ox - 1) * cw + fx, 0.0))
+                else:
+                    nx = np.full(len(points), ox)
+                    gap_x = np.zeros(len(points))
+                src = rows[gap_x * gap_x + gap_y * gap_y < r2]
+                other = ny[src] * gw + nx[src]
+                c = self.cell_count[other]
+                total = int(c.sum())
+                if total == 0:
+                    continue
+                # 把每个候选单元格的 [start, start + count) 区间展开成扁平下标
+                base = np.repeat(self.cell_start[other] - (np.cumsum(c) - c), c)
+                q = np.repeat(src, c)
+                j = self.order[np.arange(total) + base]
+                dx = wrap(px[j] - qx[q], self.width)
+                dy = wrap(py[j] - qy[q], self.height)
+                keep = dx * dx + dy * dy < r2
+                if exclude_self:
+                    keep &= q != j
+                qs.append(q[keep])
+                js.append(j[keep])
+                dxs.append(dx[keep])
+                dys.append(dy[keep])
+        if not qs:
+            return _empty_pairs()
+        d = np.stack([np.concatenate(dxs), np.concatenate(dys)], axis=1)
+        return np.concatenate(qs), np.concatenate(js), d, np.einsum("ij,ij->i", d, d)
+
+
+class KDTreeIndex(NeighborIndex):
+    """基于 scipy cKDTree 的邻居索引，使用周期边界，适合高度聚集的分布"""
+
+    def __init__(self, width, height):
+        if cKDTree is None:
+            raise ImportError("KD 树后端需要安装 scipy")
+        self.width = width
+        self.height = height
+        self.tree = None
+        self.clear()
+
+    def _wrap_points(self, points):
+        wrapped = np.mod(points, (self.width, self.height))
+        # 浮点取模可能恰好得到边界值，cKDTree 要求坐标严格小于 boxsize
+        wrapped[wrapped[:, 0] >= self.width, 0] = 0.0
+        wrapped[wrapped[:, 1] >= self.height, 1] = 0.0
+        return wrapped
+
+    def build(self, positions):
+        positions = np.asarray(positions, dtype=float).reshape(-1, 2)
+        self.migrations = len(positions)
+        self.positions = positions
+        self.tree = cKDTree(self._wrap_points(positions), boxsize=(self.width, self.height))
+        self._dirty = False
+
+    def query_pairs(self, points, radius, exclude_self=False):
+        self._ensure_built()
+        points = np.asarray(points, dtype=float).reshape(-1, 2)
+        if len(points) == 0 or len(self.positions) == 0:
+            return _empty_pairs()
+        lists = self.tree.query_ball_point(self._wrap_points(points), radius,
+                                           return_sorted=False)
+        counts = np.fromiter((len(l) for l in lists), dtype=np.intp, count=len(lists))
+        q = np.repeat(np.arange(len(points)), counts)
+        j = (np.concatenate([np.asarray(l, dtype=np.intp) for l in lists])
+             if counts.sum() else np.empty(0, dtype=np.intp))
+        return self._finish_pairs(q, j, points, radius, exclude_self)
+
+    def neighbor_pairs(self, radius):
+        self._ensure_built()
+        if len(self.positions) == 0:
+            return _empty_pairs()
+        # 树内部只枚举 i < j 的配对，再补上反向
+        half = self.tree.query_pairs(radius, output_type="ndarray").astype(np.intp)
+        q = np.concatenate([half[:, 0], half[:, 1]])
+        j = np.concatenate([half[:, 1], half[:, 0]])
+        return self._finish_pairs(q, j, self.positions, radius, True)
+
+    def nearest(self, points, radius, k=1, periodic=True):
+        if not periodic:
+            return super().nearest(points, radius, k, periodic)
+        self._ensure_built()
+        points = np.asarray(points, dtype=float).reshape(-1, 2)
+        best_j = np.full((len(points), k), -1, dtype=np.intp)
+        best_d2 = np.full((len(points), k), np.inf)
+        if len(points) == 0 or len(self.positions) == 0:
+            return best_j, best_d2
+        dist, j = self.tree.query(self._wrap_points(points), k=k, distance_upper_bound=radius)
+        dist, j = dist.reshape(len(points), k), j.reshape(len(points), k)
+        d2 = dist * dist
+        found = (j < len(self.positions)) & (d2 < radius * radius)
+        best_j[found] = j[found]
+        best_d2[found] = d2[found]
+        return best_j, best_d2
+
+    def _finish_pairs(self, q, j, points, radius, exclude_self):
+        d = self.positions[j] - points[q]
+        d[:, 0] = wrap(d[:, 0], self.width)
+        d[:, 1] = wrap(d[:, 1], self.height)
+        d2 = np.einsum("ij,ij->i", d, d)
+        # cKDTree 的半径判断包含边界，这里与网格保持一致只保留严格小于的
+        keep = d2 < radius * radius
+        if exclude_self:
+            keep &= q != j
+        return q[keep], j[keep], d[keep], d2[keep]
+
+
+class AutoIndex(NeighborIndex):
+    """根据上一帧网格的占用偏斜度在 CellGrid 与 KDTreeIndex 之间自动切换
+
+    网格的计数排序开销很小，每帧都会构建，用来测量偏斜度；偏斜度超过阈值时
+    下一帧改用 KD 树，低于阈值的 3/4 时切回网格，避免来回抖动。
+    """
+
+    def __init__(self, width, height, cell_size, skew_threshold=AUTO_SKEW_THRESHOLD):
+        self.grid = CellGrid(width, height, cell_size)
+        self.tree = KDTreeIndex(width, height) if cKDTree is not None else None
+        self.skew_threshold = skew_threshold
+        self.last_skew = 1.0
+        self.active = self.grid
+        self.clear()
+
+    def clear(self):
+        super().clear()
+        self.grid.clear()
+        if self.tree is not None:
+            self.tree.clear()
+
+    @property
+    def backend(self):
+        return "kdtree" if self.active is self.tree else "csr"
+
+    def occupancy_skew(self):
+        return self.last_skew
+
+    def build(self, positions):
+        if self.tree is not None:
+            if self.active is self.grid and self.last_skew > self.skew_threshold:
+                self.active = self.tree
+            elif self.active is self.tree and self.last_skew < 0.75 * self.skew_threshold:
+                self.active = self.grid
+        self.grid.build(positions)
+        self.last_skew = self.grid.occupancy_skew()
+        if self.active is self.tree:
+            self.tree.build(positions)
+        self.positions = self.grid.positions
+        self.migrations = self.grid.migrations
+        self._dirty = False
+
+    def rebuild(self, positions):
+        """用当前选用的索引重建，不切换也不更新偏斜度（恢复快照时使用）"""
+        self.grid.build(positions)
+        if self.active is self.tree:
+            self.tree.build(positions)
+        self.positions = self.grid.positions
+        self.migrations = self.grid.migrations
+        self._dirty = False
+
+    def query_pairs(self, points, radius, exclude_self=False):
+        self._ensure_built()
+        return self.active.query_pairs(points, radius, exclude_self)
+
+    def neighbor_pairs(self, radius):
+        self._ensure_built()
+        return self.active.neighbor_pairs(radius)
+
+    def nearest(self, points, radius, k=1, periodic=True):
+        self._ensure_built()
+        return self.active.nearest(points, radius, k, periodic)
+
+
+# 可选的邻居索引实现
+INDEX_BACKENDS = ("csr", "kdtree", "auto")
+
+
+def create_index(backend, width, height, cell_size):
+    """按名称创建邻居索引"""
+    if backend == "csr":
+        return CellGrid(width, height, cell_size)
+    if backend == "kdtree":
+        return KDTreeIndex(width, height)
+    if backend == "auto":
+        return AutoIndex(width, height, cell_size)
+    raise ValueError(f"未知的邻居索引: {backend!r}，可选 {INDEX_BACKENDS}")
@@ -0,0 +1,74 @@
+import numpy as np
+from settings import *
+
+
+class ObstacleField:
+    """静态障碍物的分桶索引，只在障碍物增删时重建
+
+    每个障碍物登记到其影响范围（半径 + reach）的包围盒覆盖的所有单元格中，
+    单元格内按障碍物顺序以 CSR 形式存储。查询时每个点只需检查自己所在单元格的
+    候选障碍物，复杂度与障碍物总数无关。障碍物不随世界环绕，超出所有影响范围
+    包围盒的点没有候选。
+    """
+
+    def __init__(self, obstacle_data=None, reach=BOID_DEFAULTS["size"] * 5,
+                 cell_size=OBSTACLE_CELL_SIZE):
+        self.reach = reach
+        self.cell_size = cell_size
+        self.rebuild(np.zeros((0, 3)) if obstacle_data is None else obstacle_data)
+
+    def __len__(self):
+        return len(self.data)
+
+    def rebuild(self, obstacle_data):
+        """obstacle_data 每行为 (x, y, radius)"""
+        data = np.asarray(obstacle_data, dtype=float).reshape(-1, 3)
+        self.data = data
+        cs = self.cell_size
+        if len(data) == 0:
+            self.origin = np.zeros(2)
+            self.grid_width = self.grid_height = 0
+            self.cell_start = self.cell_count = self.ids = np.zeros(0, dtype=np.intp)
+            return
+        extent = data[:, 2] + self.reach
+        lo = data[:, :2] - extent[:, None]
+        hi = data[:, :2] + extent[:, None]
+        self.origin = lo.min(axis=0)
+        self.grid_width, self.grid_height = (
+            np.floor((hi.max(axis=0) - self.origin) / cs).astype(np.intp) + 1)
+
+        # 每个障碍物覆盖的单元格范围 [first, last]
+        first = np.floor((lo - self.origin) / cs).astype(np.intp)
+        last = np.floor((hi - self.origin) / cs).astype(np.intp)
+        cells, ids = [], []
+        for k, ((x0, y0), (x1, y1)) in enumerate(zip(first.tolist(), last.tolist())):
+            xs, ys = np.meshgrid(np.arange(x0, x1 + 1), np.arange(y0, y1 + 1))
+            covered = (ys * self.grid_width + xs).ravel()
+            cells.append(covered)
+            ids.append(np.full(len(covered), k, dtype=np.intp))
+        cells = np.concatenate(cells)
+        ids = np.concatenate(ids)
+        # 稳定排序保持单元格内按障碍物顺序排列
+        order = np.argsort(cells, kind="stable")
+        self.ids = ids[order]
+        self.cell_count = np.bincount(cells, minlength=self.grid_width * self.grid_height)
+        self.cell_start = np.cumsum(self.cell_count) - self.cell_count
+
+    def candidates(self, points):
+        """返回扁平数组 (q, k)：查询点 q 所在单元格登记的障碍物 k，每个点内按障碍物顺序"""
+        points = np.asarray(points, dtype=float).reshape(-1, 2)
+        if len(self.data) == 0 or len(points) == 0:
+            empty = np.empty(0, dtype=np.intp)
+            return empty, empty
+        cell_xy = np.floor((points - self.origin) / self.cell_size).astype(np.intp)
+        cx, cy = cell_xy[:, 0], cell_xy[:, 1]
+        inside = (cx >= 0) & (cx < self.grid_width) & (cy >= 0) & (cy < self.grid_height)
+        src = np.flatnonzero(inside)
+        cell = cy[src] * self.grid_width + cx[src]
+        c = self.cell_count[cell]
+        total = int(c.sum())
+        if total == 0:
+            empty = np.empty(0, dtype=np.intp)
+            return empty, empty
+        base = np.repeat(self.cell_start[cell] - (np.cumsum(c) - c), c)
+        return np.repeat(src, c), self.ids[np.arange(total) + base]
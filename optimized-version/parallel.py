@@ -0,0 +1,168 @@
+import os
+import multiprocessing
+from multiprocessing import shared_memory
+import numpy as np
+from settings import *
+from flock import FlockArrays, predator_array, obstacle_field
+
+# 工作进程中的共享数组和计算用的鸟群外壳
+_worker_arrays = None
+_worker_flock = None
+
+
+def _create_shared(shape, dtype):
+    dtype = np.dtype(dtype)
+    size = max(1, int(np.prod(shape)) * dtype.itemsize)
+    shm = shared_memory.SharedMemory(create=True, size=size)
+    array = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+    array[...] = 0
+    return shm, array
+
+
+def _attach_arrays(spec):
+    shms, arrays = [], {}
+    for name, (shm_name, shape, dtype) in spec.items():
+        shm = shared_memory.SharedMemory(name=shm_name)
+        shms.append(shm)
+        arrays[name] = np.ndarray(shape, dtype=dtype, buffer=shm.buf)
+    return shms, arrays
+
+
+def _init_worker(spec, width, height, defaults, tick_rate):
+    global _worker_arrays, _worker_flock
+    shms, _worker_arrays = _attach_arrays(spec)
+    _worker_arrays["_shms"] = shms
+    # 必须使用网格索引：它的配对顺序与整体计算一致，保证结果逐位相同
+    _worker_flock = FlockArrays(capacity=1, backend="csr", width=width, height=height,
+                                defaults=defaults, tick_rate=tick_rate)
+
+
+def _tile_forces(task):
+    """计算一个纵向条带内所有Boid的行为力，写入共享的加速度数组"""
+    front, n, tile, tiles, obstacles, params = task
+    arrays = _worker_arrays
+    flock = _worker_flock
+    flock.pos = arrays[f"pos{front}"]
+    flock.vel = arrays[f"vel{front}"]
+    flock.state = arrays["state"]
+    flock.is_leader = arrays["is_leader"]
+    flock.leader_target = arrays["leader_target"]
+    flock.threat = arrays["threat"]
+    flock.n = n
+
+    pos = flock.pos[:n]
+    width = flock.width
+    wrapped_x = pos[:, 0] % width
+    # 每个进程用同一公式划分条带，保证每只Boid恰好属于一个条带
+    rows = np.flatnonzero(np.minimum((wrapped_x * tiles // width).astype(np.intp), tiles - 1) == tile)
+    if len(rows) == 0:
+        return 0
+    margin = flock.perception
+    tile_width = width / tiles
+    rel = (wrapped_x - tile * tile_width) % width
+    # 条带两侧宽度为 perception 的幽灵区，保证条带内Boid的邻居都在索引中
+    ghosts = np.flatnonzero((rel < tile_width + margin) | (rel >= width - margin))
+    flock.index.build(pos[ghosts])
+    q, local, d, d2 = flock.index.query_pairs(pos[rows], flock.perception)
+    j = ghosts[local]
+    keep = j != rows[q]
+    forces = flock.steering_forces(rows, q[keep], j[keep], d[keep], d2[keep],
+                                   obstacles, params)
+    arrays["acc"][rows] += forces
+    return len(rows)
+
+
+class ParallelStepper:
+    """在进程池中并行计算鸟群行为力
+
+    世界按 x 方向切成若干纵向条带，每个工作进程负责一个条带并读取宽度为
+    perception 的幽灵区。Boid状态保存在 multiprocessing.shared_memory 中：
+    工作进程只读取前台缓冲区的位置/速度，主进程在后台缓冲区完成积分后交换，
+    结果与串行的 FlockArrays 逐位一致。
+    """
+
+    def __init__(self, flock, workers=PARALLEL_WORKERS):
+        self.workers = workers or os.cpu_count() or 1
+        self.flock = None
+        self.pool = None
+        self._shms = []
+        self.attach(flock)
+
+    def attach(self, flock):
+        """把鸟群的数组迁移到共享内存并启动进程池"""
+        self.close()
+        self.flock = flock
+        n = flock.n
+        arrays = {}
+        spec = {}
+        for name, source in (("pos0", flock.pos), ("vel0", flock.vel),
+                             ("pos1", flock.pos), ("vel1", flock.vel),
+                             ("acc", flock.acc), ("state", flock.state),
+                             ("is_leader", flock.is_leader),
+                             ("leader_target", flock.leader_target),
+                             ("threat", flock.threat)):
+            shape = (n,) + source.shape[1:]
+            shm, array = _create_shared(shape, source.dtype)
+            array[...] = source[:n]
+            self._shms.append(shm)
+            arrays[name] = array
+            spec[name] = (shm.name, shape, source.dtype.str)
+        self.arrays = arrays
+        self.front = 0
+        self._rehome()
+
+        self.tiles = max(1, min(2 * self.workers, int(flock.width // flock.perception)))
+        defaults = dict(flock.defaults, max_trail=0)
+        self.pool = multiprocessing.Pool(self.workers, initializer=_init_worker,
+                                         initargs=(spec, flock.width, flock.height, defaults,
+                                                   flock.tick_rate))
+
+    def _rehome(self):
+        flock = self.flock
+        arrays = self.arrays
+        flock.pos = arrays[f"pos{self.front}"]
+        flock.vel = arrays[f"vel{self.front}"]
+        flock.acc = arrays["acc"]
+        flock.state = arrays["state"]
+        flock.is_leader = arrays["is_leader"]
+        flock.leader_target = arrays["leader_target"]
+        flock.threat = arrays["threat"]
+
+    def step(self, predators, obstacles, params):
+        """并行计算行为力，再在后台缓冲区积分并交换前后台"""
+        flock = self.flock
+        if flock.pos is not self.arrays[f"pos{self.front}"] or flock.n != len(flock.pos):
+            # 鸟群扩容后数组已不在共享内存中，重新迁移
+            self.attach(flock)
+        n = flock.n
+        if n == 0:
+            return
+        predator_pos = predator_array(predators)
+        flock.prepare(predator_pos)
+        obstacles = obstacle_field(obstacles)
+        tasks = [(self.front, n, tile, self.tiles, obstacles, dict(params))
+                 for tile in range(self.tiles)]
+        self.pool.map(_tile_forces, tasks)
+
+        back = 1 - self.front
+        self.arrays[f"pos{back}"][...] = self.arrays[f"pos{self.front}"]
+        self.arrays[f"vel{back}"][...] = self.arrays[f"vel{self.front}"]
+        self.front = back
+        self._rehome()
+        flock.update()
+
+    def close(self):
+        """关闭进程池并把数组复制回普通内存，释放共享内存"""
+        if self.pool is not None:
+            self.pool.close()
+            self.pool.join()
+            self.pool = None
+        if self._shms:
+            flock = self.flock
+            for name in ("pos", "vel", "acc", "state", "is_leader", "leader_target", "threat"):
+                setattr(flock, name, np.array(getattr(flock, name)))
+            self.arrays = {}
+            for shm in self._shms:
+                shm.close()
+                shm.unlink()
+            self._shms = []
@@ -0,0 +1,76 @@
+import csv
+import json
+import time
+from collections import deque
+from contextlib import contextmanager
+import numpy as np
+from settings import PROFILER_WINDOW
+
+
+class FrameProfiler:
+    """按阶段记录每帧耗时（perf_counter_ns），维护滚动分位数并可导出
+
+    每个阶段只保留最近 window 次的耗时用于计算 p50/p95/p99；
+    同时保留最近的事件序列，用于导出 Chrome trace（chrome://tracing）。
+    """
+
+    def __init__(self, window=PROFILER_WINDOW):
+        self.window = window
+        self.samples = {}
+        self.events = deque(maxlen=window * 16)
+        self.frames = 0
+        self._origin = time.perf_counter_ns()
+
+    @contextmanager
+    def phase(self, name):
+        start = time.perf_counter_ns()
+        try:
+            yield
+        finally:
+            self.record(name, start, time.perf_counter_ns() - start)
+
+    def record(self, name, start, duration):
+        samples = self.samples.get(name)
+        if samples is None:
+            samples = self.samples[name] = deque(maxlen=self.window)
+        samples.append(duration)
+        self.events.append((name, start, duration, self.frames))
+
+    def end_frame(self):
+        self.frames += 1
+
+    def percentiles(self, name):
+        """返回某阶段最近耗时的 (p50, p95, p99)，单位毫秒"""
+        samples = self.samples.get(name)
+        if not samples:
+            return 0.0, 0.0, 0.0
+        p50, p95, p99 = np.percentile(np.fromiter(samples, dtype=np.int64), (50, 95, 99))
+        return float(p50) / 1e6, float(p95) / 1e6, float(p99) / 1e6
+
+    def summary(self):
+        """[(阶段, 次数, 平均ms, p50, p95, p99), ...]，按首次出现的顺序"""
+        rows = []
+        for name, samples in self.samples.items():
+            mean = sum(samples) / len(samples) / 1e6
+            rows.append((name, len(samples), mean, *self.percentiles(name)))
+        return rows
+
+    def dump_csv(self, path):
+        with open(path, "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(("phase", "count", "mean_ms", "p50_ms", "p95_ms", "p99_ms"))
+            for row in self.summary():
+                writer.writerow((row[0], row[1], *(f"{v:.4f}" for v in row[2:])))
+
+    def dump_chrome_trace(self, path):
+        events = [{
+            "name": name,
+            "ph": "X",
+            "ts": (start - self._origin) / 1e3,
+            "dur": duration / 1e3,
+            "pid": 0,
+            "tid": 0,
+            "args": {"frame": frame},
+        } for name, start, duration, frame in self.events]
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"traceEvents": events, "displayTimeUnit": "ms"}, f)
@@ -0,0 +1,187 @@
+import json
+import os
+import queue
+import threading
+import zlib
+import numpy as np
+from settings import *
+from flock import obstacle_array
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+try:
+    import lz4.frame
+except ImportError:
+    lz4 = None
+
+# 录制文件格式版本
+FORMAT_VERSION = 1
+
+
+def _codecs():
+    """可用的压缩方式: 名称 -> (压缩函数, 解压函数)；"none" 写成可内存映射的 .npy"""
+    codecs = {"zlib": (lambda data: zlib.compress(data, 1), zlib.decompress)}
+    if lz4 is not None:
+        codecs["lz4"] = (lz4.frame.compress, lz4.frame.decompress)
+    if zstandard is not None:
+        codecs["zstd"] = (zstandard.ZstdCompressor(level=3).compress,
+                          lambda data: zstandard.ZstdDecompressor().decompress(data))
+    return codecs
+
+
+CODECS = _codecs()
+
+
+def resolve_codec(codec):
+    """"auto" 依次选择 zstd、lz4、zlib"""
+    if codec == "auto":
+        return next(name for name in ("zstd", "lz4", "zlib") if name in CODECS)
+    if codec != "none" and codec not in CODECS:
+        raise ValueError(f"不可用的压缩方式: {codec!r}，可选 {('auto', 'none') + tuple(CODECS)}")
+    return codec
+
+
+def _float(array):
+    # 总是复制：后台线程写入时模拟已经在修改原数组
+    return np.array(array, dtype=RECORD_FLOAT_DTYPE)
+
+
+# 可录制的字段 -> 从模拟世界取出一帧数据的函数
+FIELDS = {
+    "pos": lambda sim: _float(sim.flock.pos[:sim.flock.n]),
+    "vel": lambda sim: _float(sim.flock.vel[:sim.flock.n]),
+    "state": lambda sim: sim.flock.state[:sim.flock.n].copy(),
+    "is_leader": lambda sim: sim.flock.is_leader[:sim.flock.n].copy(),
+    "predators": lambda sim: _float(np.array([(*p.position, *p.velocity) for p in sim.predators],
+                                             dtype=float).reshape(-1, 4)),
+    "obstacles": lambda sim: _float(obstacle_array(sim.obstacles)),
+}
+
+
+def chunk_file(field, chunk, codec):
+    suffix = "npy" if codec == "none" else codec
+    return f"{field}.{chunk:06d}.{suffix}"
+
+
+class TrajectoryRecorder:
+    """把每步的鸟群状态流式写入分块、压缩的列式文件
+
+    作为观察者挂在 Simulation 上（sim.add_observer(recorder.on_step)）。主线程只复制
+    选中的字段并放入有界队列，队列满时丢弃该帧而不是阻塞模拟；后台线程把帧攒成
+    chunk_frames 帧一块，每个字段单独写一个文件。目录下的 meta.json 记录所有块，
+    每写完一块就更新一次，进程中途退出时已写入的块仍然可用。
+    """
+
+    def __init__(self, path, fields=RECORD_FIELDS, every=RECORD_EVERY,
+                 chunk_frames=RECORD_CHUNK_FRAMES, codec=RECORD_CODEC,
+                 queue_size=RECORD_QUEUE_SIZE, world=(WIDTH, HEIGHT), boid=BOID_DEFAULTS,
+                 predator=PREDATOR_DEFAULTS):
+        unknown = set(fields) - set(FIELDS)
+        if unknown:
+            raise ValueError(f"未知的录制字段: {sorted(unknown)}，可选 {tuple(FIELDS)}")
+        self.path = path
+        self.fields = tuple(fields)
+        self.every = max(1, every)
+        self.chunk_frames = max(1, chunk_frames)
+        self.codec = resolve_codec(codec)
+        self.dropped = 0
+        self.frames = 0
+        self.meta = {
+            "version": FORMAT_VERSION,
+            "fields": list(self.fields),
+            "every": self.every,
+            "codec": self.codec,
+            "world": list(world),
+            # 回放时按录制时的大小和感知范围绘制
+            "boid": dict(boid),
+            "predator": dict(predator),
+            "frames": 0,
+            "dropped": 0,
+            "chunks": [],
+        }
+        os.makedirs(path, exist_ok=True)
+        self._queue = queue.Queue(maxsize=queue_size)
+        self._buffer = []
+        self._thread = threading.Thread(target=self._run, name="trajectory-recorder", daemon=True)
+        self._thread.start()
+
+    def on_step(self, sim):
+        """模拟每步之后调用；按抽帧间隔复制数据并交给后台线程"""
+        if sim.steps % self.every:
+            return
+        frame = {name: FIELDS[name](sim) for name in self.fields}
+        frame["step"] = sim.steps
+        try:
+            self._queue.put_nowait(frame)
+        except queue.Full:
+            self.dropped += 1
+
+    def close(self):
+        """写出剩余的帧并结束后台线程"""
+        if self._thread is None:
+            return
+        self._queue.put(None)
+        self._thread.join()
+        self._thread = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    # --- 后台线程 ---
+
+    def _run(self):
+        while True:
+            frame = self._queue.get()
+            if frame is None:
+                break
+            # 数组形状变化（例如新增了捕食者）时先结束当前块
+            if self._buffer and any(frame[name].shape != self._buffer[0][name].shape
+                                    for name in self.fields):
+                self._flush()
+            self._buffer.append(frame)
+            if len(self._buffer) >= self.chunk_frames:
+                self._flush()
+        self._flush()
+        self.meta["dropped"] = self.dropped
+        self._write_meta()
+
+    def _flush(self):
+        if not self._buffer:
+            return
+        frames = self._buffer
+        self._buffer = []
+        index = len(self.meta["chunks"])
+        chunk = {
+            "index": index,
+            "frames": len(frames),
+            "steps": [frame["step"] for frame in frames],
+            "fields": {},
+        }
+        for name in self.fields:
+            data = np.stack([frame[name] for frame in frames])
+            filename = chunk_file(name, index, self.codec)
+            target = os.path.join(self.path, filename)
+            if self.codec == "none":
+                np.save(target, data)
+            else:
+                with open(target, "wb") as f:
+                    f.write(CODECS[self.codec][0](data.tobytes()))
+            chunk["fields"][name] = {"file": filename, "dtype": data.dtype.str,
+                                     "shape": list(data.shape)}
+        self.meta["chunks"].append(chunk)
+        self.frames += len(frames)
+        self.meta["frames"] = self.frames
+        self.meta["dropped"] = self.dropped
+        self._write_meta()
+
+    def _write_meta(self):
+        target = os.path.join(self.path, "meta.json")
+        with open(target + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(self.meta, f)
+        os.replace(target + ".tmp", target)
@@ -0,0 +1,154 @@
+import math
+import numpy as np
+import pygame
+from pygame.math import Vector2
+from settings import *
+
+# 可选的绘制模式："sprites" 为预旋转精灵批量 blit，"pixels" 为直接写像素缓冲区
+RENDER_MODES = ("sprites", "pixels")
+# 像素模式下每只Boid点亮的像素（十字形）
+PIXEL_OFFSETS = ((0, 0), (1, 0), (-1, 0), (0, 1), (0, -1))
+
+
+def boid_shape(size):
+    """与 Boid.draw 相同的三角形，机头朝向 +x"""
+    return ((size, 0), (-size / 2, size / 2), (-size / 2, -size / 2))
+
+
+def predator_shape(size):
+    """与 Predator.draw 相同的三角形，机头朝向 +x"""
+    return ((size, 0), (-size, size * 0.7), (-size, -size * 0.7))
+
+
+class SpriteSheet:
+    """把一个多边形按 buckets 个朝向预先旋转绘制到带透明通道的小图上"""
+
+    def __init__(self, shape, color, buckets):
+        self.buckets = buckets
+        self.radius = math.ceil(max(math.hypot(x, y) for x, y in shape)) + 1
+        side = 2 * self.radius + 1
+        self.sprites = []
+        for bucket in range(buckets):
+            theta = 2 * math.pi * bucket / buckets
+            c, s = math.cos(theta), math.sin(theta)
+            points = [(self.radius + x * c - y * s, self.radius + x * s + y * c) for x, y in shape]
+            surface = pygame.Surface((side, side), pygame.SRCALPHA)
+            pygame.draw.polygon(surface, color, points)
+            if pygame.display.get_surface() is not None:
+                surface = surface.convert_alpha()
+            self.sprites.append(surface)
+
+    def buckets_for(self, vel):
+        """把速度方向量化为朝向桶的下标"""
+        heading = np.arctan2(vel[:, 1], vel[:, 0])
+        return np.rint(heading * (self.buckets / (2 * math.pi))).astype(np.intp) % self.buckets
+
+    def blit_sequence(self, pos, vel):
+        """生成 Surface.blits 所需的 (精灵, 左上角) 序列"""
+        sprites = self.sprites
+        corners = np.rint(pos - self.radius).astype(np.intp).tolist()
+        return [(sprites[b], tuple(c)) for b, c in zip(self.buckets_for(vel).tolist(), corners)]
+
+
+class BoidRenderer:
+    """批量绘制鸟群和捕食者
+
+    朝向被量化到 buckets 个角度，每个角度的三角形只在第一次使用时绘制一次，
+    之后每帧用一次 Surface.blits 把所有Boid贴到屏幕上。像素模式直接根据
+    鸟群的位置数组写入 pygame.surfarray 像素缓冲区，适合数万只Boid。
+    """
+
+    def __init__(self, buckets=RENDER_ANGLE_BUCKETS, mode=RENDER_MODE):
+        if mode not in RENDER_MODES:
+            raise ValueError(f"未知的绘制模式: {mode!r}，可选 {RENDER_MODES}")
+        self.buckets = buckets
+        self.mode = mode
+        self._sheets = {}
+
+    def sheet(self, shape, color):
+        """按 (形状, 颜色) 缓存的精灵表"""
+        key = (shape, color)
+        sheet = self._sheets.get(key)
+        if sheet is None:
+            sheet = self._sheets[key] = SpriteSheet(shape, color, self.buckets)
+        return sheet
+
+    def toggle_mode(self):
+        self.mode = RENDER_MODES[(RENDER_MODES.index(self.mode) + 1) % len(RENDER_MODES)]
+
+    def draw(self, screen, flock, predators, positions=None, predator_positions=None):
+        """positions / predator_positions 可传入插值后的坐标，默认使用当前状态"""
+        self.draw_flock(screen, flock, positions)
+        self.draw_predators(screen, predators, predator_positions)
+
+    def draw_flock(self, screen, flock, positions=None):
+        n = flock.n
+        if n == 0:
+            return
+        pos = flock.pos[:n] if positions is None else positions
+        vel = flock.vel[:n]
+        self._draw_trails(screen, flock)
+
+        if self.mode == "pixels":
+            self._plot(screen, pos, BOID_COLOR)
+        else:
+            sheet = self.sheet(boid_shape(flock.size), BOID_COLOR)
+            screen.blits(sheet.blit_sequence(pos, vel), doreturn=False)
+
+        for i in np.flatnonzero(flock.is_leader[:n]).tolist():
+            self._draw_leader(screen, flock, pos, i)
+
+    def draw_predators(self, screen, predators, positions=None):
+        if not predators:
+            return
+        size = predators[0].size
+        color = predators[0].color
+        pos = (np.array([predator.position for predator in predators])
+               if positions is None else positions)
+        vel = np.array([predator.velocity for predator in predators])
+        sheet = self.sheet(predator_shape(size), color)
+        screen.blits(sheet.blit_sequence(pos, vel), doreturn=False)
+        for predator, center in zip(predators, pos.tolist()):
+            pygame.draw.circle(screen, (*predator.color, 40), center, predator.perception, 1)
+
+    def _draw_trails(self, screen, flock):
+        max_trail = flock.max_trail
+        if max_trail < 2:
+            return
+        color = (*TRAIL_COLOR[:3], 100)
+        lengths = flock.trail_len[:flock.n]
+        rows = np.flatnonzero(lengths > 1)
+        # 一次性按从旧到新的顺序取出并取整所有轨迹，再逐条画折线
+        trails = flock.trail[rows][:, flock.trail_order()].astype(np.intp)
+        if self.mode == "pixels":
+            valid = np.arange(max_trail) >= (max_trail - lengths[rows])[:, None]
+            self._plot(screen, trails[valid], color, ((0, 0),))
+            return
+        for points, length in zip(trails.tolist(), lengths[rows].tolist()):
+            pygame.draw.lines(screen, color, False, points[max_trail - length:], 1)
+
+    def _plot(self, screen, pos, color, offsets=PIXEL_OFFSETS):
+        """把每个位置按 offsets 点亮若干像素，直接写入屏幕的像素缓冲区"""
+        width, height = screen.get_size()
+        xy = pos.astype(np.intp)
+        value = screen.map_rgb(color)
+        pixels = pygame.surfarray.pixels2d(screen)
+        for dx, dy in offsets:
+            x = xy[:, 0] + dx
+            y = xy[:, 1] + dy
+            inside = (x >= 0) & (x < width) & (y >= 0) & (y < height)
+            pixels[x[inside], y[inside]] = value
+        # 释放像素数组才会解锁屏幕
+        del pixels
+
+    def _draw_leader(self, screen, flock, pos, i):
+        """领导者用高亮颜色绘制，并显示感知范围和视野"""
+        sheet = self.sheet(boid_shape(flock.size), HIGHLIGHT_COLOR)
+        screen.blits(sheet.blit_sequence(pos[i:i + 1], flock.vel[i:i + 1]), doreturn=False)
+        position = Vector2(*pos[i])
+        angle = Vector2(*flock.vel[i]).angle_to(Vector2(1, 0))
+        color = (*HIGHLIGHT_COLOR, 60)
+        pygame.draw.circle(screen, color, position, flock.perception, 1)
+        for side in (-1, 1):
+            fov_line = position + Vector2(flock.perception, 0).rotate(-angle + side * flock.fov_angle / 2)
+            pygame.draw.line(screen, color, position, fov_line, 1)
@@ -0,0 +1,243 @@
+import json
+import os
+import queue
+import sys
+import threading
+from collections import OrderedDict
+import numpy as np
+import pygame
+from pygame.locals import *
+from settings import *
+from flock import FlockArrays
+from entities.predator import Predator
+from entities.obstacle import Obstacle
+from recorder import CODECS, FORMAT_VERSION
+from renderer import BoidRenderer
+from utils import init_fonts, text_cache
+
+
+class TrajectoryReader:
+    """按帧读取 TrajectoryRecorder 录制的目录
+
+    数据块在第一次用到时才读取：未压缩的 .npy 直接内存映射，压缩块解压到内存。
+    最近用过的 cache_chunks 个块保留在缓存中，后台线程按播放方向预取下一个块。
+    """
+
+    def __init__(self, path, cache_chunks=REPLAY_CACHE_CHUNKS):
+        self.path = path
+        with open(os.path.join(path, "meta.json"), encoding="utf-8") as f:
+            self.meta = json.load(f)
+        if self.meta["version"] != FORMAT_VERSION:
+            raise ValueError(f"{path}: 不支持的录制格式版本 {self.meta['version']}")
+        self.fields = tuple(self.meta["fields"])
+        if "pos" not in self.fields:
+            raise ValueError(f"{path}: 录制中没有 pos 字段，无法回放（录制的字段: {self.fields}）")
+        self.chunks = self.meta["chunks"]
+        # 每个块第一帧的全局帧号
+        self.chunk_starts = np.cumsum([0] + [chunk["frames"] for chunk in self.chunks])
+        self.frames = int(self.chunk_starts[-1])
+        self.cache_chunks = max(2, cache_chunks)
+        self._cache = OrderedDict()
+        self._lock = threading.Lock()
+        self._requests = queue.Queue()
+        self._thread = threading.Thread(target=self._prefetch, name="replay-prefetch", daemon=True)
+        self._thread.start()
+
+    def __len__(self):
+        return self.frames
+
+    def locate(self, frame):
+        """全局帧号 -> (块下标, 块内偏移)"""
+        chunk = int(np.searchsorted(self.chunk_starts, frame, side="right")) - 1
+        return chunk, frame - int(self.chunk_starts[chunk])
+
+    def frame(self, frame, direction=1):
+        """返回第 frame 帧的 {字段: 数组}，并预取播放方向上的下一个块"""
+        chunk, offset = self.locate(frame)
+        data = self.chunk(chunk)
+        following = chunk + (1 if direction >= 0 else -1)
+        if 0 <= following < len(self.chunks):
+            self._requests.put(following)
+        result = {name: data[name][offset] for name in self.fields}
+        result["step"] = self.chunks[chunk]["steps"][offset]
+        return result
+
+    def chunk(self, index):
+        with self._lock:
+            data = self._cache.get(index)
+            if data is not None:
+                self._cache.move_to_end(index)
+                return data
+        data = self._load(index)
+        with self._lock:
+            self._cache[index] = data
+            self._cache.move_to_end(index)
+            while len(self._cache) > self.cache_chunks:
+                self._cache.popitem(last=False)
+        return data
+
+    def _load(self, index):
+        chunk = self.chunks[index]
+        codec = self.meta["codec"]
+        data = {}
+        for name, spec in chunk["fields"].items():
+            target = os.path.join(self.path, spec["file"])
+            if codec == "none":
+                data[name] = np.load(target, mmap_mode="r")
+            else:
+                with open(target, "rb") as f:
+                    raw = CODECS[codec][1](f.read())
+                data[name] = np.frombuffer(raw, dtype=spec["dtype"]).reshape(spec["shape"])
+        return data
+
+    def _prefetch(self):
+        while True:
+            index = self._requests.get()
+            if index is None:
+                break
+            with self._lock:
+                cached = index in self._cache
+            if not cached:
+                self.chunk(index)
+
+    def close(self):
+        self._requests.put(None)
+        self._thread.join()
+
+
+class ReplayWorld:
+    """把一帧录制数据装入绘制所需的对象：鸟群数组外壳、捕食者和障碍物
+
+    boid_defaults 和 predator_defaults 为绘制使用的实体参数（大小、感知范围、视野）。
+    """
+
+    def __init__(self, boid_defaults=BOID_DEFAULTS, predator_defaults=PREDATOR_DEFAULTS):
+        # 旧的录制没有保存实体参数，缺少的键取默认值
+        self.boid_defaults = dict(BOID_DEFAULTS, **boid_defaults)
+        self.predator_defaults = dict(PREDATOR_DEFAULTS, **predator_defaults)
+        self.flock = None
+        self.predators = []
+        self.obstacles = []
+        self._obstacle_data = None
+
+    def load(self, frame):
+        pos = frame["pos"]
+        n = len(pos)
+        if self.flock is None or len(self.flock.pos) < n:
+            self.flock = FlockArrays(capacity=n, backend="csr", defaults=self.boid_defaults)
+            self.flock.set_trail_length(0)
+        flock = self.flock
+        flock.n = n
+        flock.pos[:n] = pos
+        flock.vel[:n] = frame["vel"] if "vel" in frame else 0
+        flock.is_leader[:n] = frame["is_leader"] if "is_leader" in frame else False
+
+        predators = frame.get("predators")
+        if predators is not None:
+            while len(self.predators) < len(predators):
+                self.predators.append(Predator(0, 0, defaults=self.predator_defaults))
+            del self.predators[len(predators):]
+            for predator, (x, y, vx, vy) in zip(self.predators, predators.tolist()):
+                predator.position.update(x, y)
+                predator.velocity.update(vx, vy)
+
+        obstacles = frame.get("obstacles")
+        if obstacles is not None and not np.array_equal(obstacles, self._obstacle_data):
+            self._obstacle_data = np.array(obstacles)
+            self.obstacles = [Obstacle(x, y, radius) for x, y, radius in obstacles.tolist()]
+
+
+class ReplayPlayer:
+    """播放位置、速度和方向；speed 为每个显示帧前进的录制帧数，负数表示倒放"""
+
+    def __init__(self, reader):
+        self.reader = reader
+        self.position = 0.0
+        self.speed = 1.0
+        self.paused = False
+
+    @property
+    def frame(self):
+        return int(self.position)
+
+    def seek(self, frame):
+        self.position = float(min(max(frame, 0), len(self.reader) - 1))
+
+    def advance(self):
+        if not self.paused:
+            self.seek(self.position + self.speed)
+
+    def faster(self):
+        self.speed = max(-REPLAY_MAX_SPEED, min(REPLAY_MAX_SPEED, self.speed * 2))
+
+    def slower(self):
+        self.speed /= 2
+
+    def reverse(self):
+        self.speed = -self.speed
+
+
+def replay_main(path):
+    """回放模式主循环：不运行模拟，直接用录制的帧驱动绘制"""
+    reader = TrajectoryReader(path)
+    if len(reader) == 0:
+        print(f"{path}: 没有录制的帧")
+        return
+    pygame.init()
+    # 窗口与录制时的世界大小一致
+    screen = pygame.display.set_mode(tuple(reader.meta.get("world", (WIDTH, HEIGHT))))
+    pygame.display.set_caption(f"Boids Replay - {path}")
+    font, _ = init_fonts()
+    clock = pygame.time.Clock()
+    player = ReplayPlayer(reader)
+    world = ReplayWorld(reader.meta.get("boid", {}), reader.meta.get("predator", {}))
+    renderer = BoidRenderer()
+    # 每隔 every 步录制一帧，约一秒的模拟对应 FPS / every 帧
+    jump = max(1, round(FPS / reader.meta["every"]))
+
+    while True:
+        for event in pygame.event.get():
+            if event.type == QUIT or (event.type == KEYDOWN and event.key == K_ESCAPE):
+                reader.close()
+                pygame.quit()
+                sys.exit()
+            elif event.type == KEYDOWN:
+                if event.key == K_SPACE:
+                    player.paused = not player.paused
+                elif event.key == K_r:  # 倒放/正放
+                    player.reverse()
+                elif event.key == K_UP:
+                    player.faster()
+                elif event.key == K_DOWN:
+                    player.slower()
+                elif event.key == K_LEFT:  # 前后跳转约一秒的模拟
+                    player.seek(player.position - jump)
+                elif event.key == K_RIGHT:
+                    player.seek(player.position + jump)
+                elif event.key == K_HOME:
+                    player.seek(0)
+                elif event.key == K_END:
+                    player.seek(len(reader) - 1)
+                elif event.key == K_v:
+                    renderer.toggle_mode()
+                elif K_0 <= event.key <= K_9:  # 跳到 0%-90% 处
+                    player.seek((event.key - K_0) * len(reader) // 10)
+
+        frame = reader.frame(player.frame, 1 if player.speed >= 0 else -1)
+        world.load(frame)
+
+        screen.fill(BACKGROUND)
+        for obstacle in world.obstacles:
+            obstacle.draw(screen)
+        renderer.draw(screen, world.flock, world.predators)
+
+        lines = (
+            f"回放 {player.frame + 1}/{len(reader)}  模拟步 {frame['step']}  "
+            f"速度 x{player.speed:g}{'  (暂停)' if player.paused else ''}",
+            "空格键: 暂停, R: 倒放, 上/下键: 加速/减速, 左/右键: 跳转, 0-9: 跳到进度, ESC: 退出",
+        )
+        screen.blit(text_cache.render_block(font, lines, TEXT_COLOR, 25), (20, screen.get_height() - 65))
+
+        pygame.display.flip()
+        player.advance()
+        clock.tick(FPS)
@@ -0,0 +1,132 @@
+"""无窗口批量运行模拟并报告每秒步数
+
+用法: python run.py --boids 20000 --steps 5000 --seed 1
+      python run.py --scenario scenarios/*.toml --engine parallel
+"""
+import argparse
+import os
+import sys
+import time
+
+os.environ.setdefault("PYGAME_HIDE_SUPPORT_PROMPT", "1")
+
+from settings import *
+from simulation import ENGINES, GRID_BACKENDS
+from neighbors import INDEX_BACKENDS
+from recorder import TrajectoryRecorder, FIELDS
+from scenario import Scenario, ScenarioError, KERNELS, create_simulation, load_scenario
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Headless Boids batch runner")
+    parser.add_argument("--scenario", nargs="+", metavar="FILE",
+                        help="场景文件 (.toml/.json)，给出多个时依次运行；下面显式给出的参数覆盖场景中的值")
+    parser.add_argument("--boids", type=int, help=f"Boid数量（默认 {INITIAL_BOIDS}）")
+    parser.add_argument("--predators", type=int, help=f"捕食者数量（默认 {INITIAL_PREDATORS}）")
+    parser.add_argument("--obstacles", type=int, help=f"障碍物数量（默认 {INITIAL_OBSTACLES}）")
+    parser.add_argument("--steps", type=int, help="模拟步数（默认 1000）")
+    parser.add_argument("--seed", type=int, help="随机种子")
+    parser.add_argument("--engine", choices=ENGINES, help="更新引擎（默认 numpy）")
+    parser.add_argument("--grid", choices=GRID_BACKENDS,
+                        help=f"捕食者/逐对象引擎使用的空间网格（默认 {GRID_BACKEND}）")
+    parser.add_argument("--neighbors", choices=INDEX_BACKENDS,
+                        help=f"批量引擎使用的Boid邻居索引（默认 {NEIGHBOR_BACKEND}）")
+    parser.add_argument("--kernel", choices=KERNELS,
+                        help="批量引擎计算规则力的内核（numba 不可用时回退到 numpy）")
+    parser.add_argument("--workers", type=int,
+                        help="并行引擎的工作进程数（0 表示全部CPU核）")
+    parser.add_argument("--predator-claim", action="store_true", default=None,
+                        help="捕食者互相认领目标，不追同一只Boid")
+    parser.add_argument("--lod-ms", type=float,
+                        help="批量引擎行为力计算的每步时间预算（毫秒），0 表示每步更新全部Boid")
+    parser.add_argument("--tick-rate", type=int,
+                        help=f"模拟每秒的步数，只改变每步积分的时间（默认 {SIM_TICK_RATE}）")
+    parser.add_argument("--record", metavar="DIR",
+                        help="把轨迹录制到该目录（多个场景时每个场景一个子目录）")
+    parser.add_argument("--record-every", type=int, default=RECORD_EVERY, help="录制的抽帧间隔")
+    parser.add_argument("--record-fields", nargs="+", choices=tuple(FIELDS),
+                        default=list(RECORD_FIELDS), help="录制的字段")
+    parser.add_argument("--record-codec", default=RECORD_CODEC,
+                        help="压缩方式: auto, zstd, lz4, zlib 或 none")
+    parser.add_argument("--report-every", type=int, default=0,
+                        help="每隔多少步打印一次进度（0 表示只在结束时报告）")
+    return parser.parse_args(argv)
+
+
+# 命令行参数 -> 被它覆盖的场景字段
+OVERRIDES = {
+    "boids": "boids", "predators": "predators", "obstacles": "obstacles", "steps": "steps",
+    "seed": "seed", "engine": "engine", "grid": "grid_backend", "neighbors": "neighbor_backend",
+    "kernel": "kernel", "workers": "workers", "predator_claim": "predator_claim",
+    "lod_ms": "lod_ms", "tick_rate": "tick_rate",
+}
+
+
+def run_scenario(scenario, args, record=None):
+    sim = create_simulation(scenario)
+    recorder = None
+    # 出错时也要释放并行引擎的共享内存和录制器
+    try:
+        if record:
+            recorder = TrajectoryRecorder(record, fields=args.record_fields,
+                                          every=args.record_every, codec=args.record_codec,
+                                          world=(scenario.width, scenario.height),
+                                          boid=scenario.boid.as_dict(),
+                                          predator=scenario.predator.as_dict())
+            sim.add_observer(recorder.on_step)
+
+        steps = scenario.steps
+        start = time.perf_counter()
+        done = 0
+        chunk = args.report_every or steps
+        while done < steps:
+            n = min(chunk, steps - done)
+            sim.step(n)
+            done += n
+            if args.report_every:
+                elapsed = time.perf_counter() - start
+                print(f"step {done}/{steps}  {done / elapsed:.1f} steps/s")
+        elapsed = time.perf_counter() - start
+        digest = sim.state_hash()
+    finally:
+        sim.close()
+        if recorder is not None:
+            recorder.close()
+
+    rate = done / elapsed if elapsed > 0 else float("inf")
+    if args.scenario:
+        print(f"scenario: {scenario.name} ({scenario.width}x{scenario.height})")
+    print(f"{sim.flock.n} boids, {len(sim.predators)} predators, {len(sim.obstacles)} obstacles, "
+          f"engine={scenario.engine}, grid={scenario.grid_backend}, "
+          f"neighbors={scenario.neighbor_backend}, kernel={sim.flock.kernel}")
+    print(f"{done} steps in {elapsed:.2f}s ({rate:.1f} steps/s, "
+          f"{1000 * elapsed / max(done, 1):.2f} ms/step)")
+    if sim.lod is not None:
+        print(f"LOD: interval {sim.lod.interval}, last step updated {sim.lod.updated}/{sim.flock.n} boids")
+    print(f"state hash: {digest}")
+    if recorder is not None:
+        print(f"recorded {recorder.frames} frames ({recorder.dropped} dropped, "
+              f"codec={recorder.codec}) to {record}")
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    overrides = {field: getattr(args, name) for name, field in OVERRIDES.items()
+                 if getattr(args, name) is not None}
+    try:
+        scenarios = ([load_scenario(path) for path in args.scenario] if args.scenario
+                     else [Scenario()])
+        scenarios = [scenario.replace(**overrides) for scenario in scenarios]
+    except ScenarioError as e:
+        sys.exit(f"场景错误: {e}")
+    for k, scenario in enumerate(scenarios):
+        if k:
+            print()
+        record = args.record
+        if record and len(scenarios) > 1:
+            record = os.path.join(record, scenario.name)
+        run_scenario(scenario, args, record)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,333 @@
+"""场景文件：用 TOML 或 JSON 描述一次模拟的世界、实体、参数和脚本事件
+
+示例 (TOML):
+
+    name = "hazards"
+    seed = 1
+    steps = 2000
+
+    [world]
+    width = 1600
+    height = 900
+
+    [engine]
+    engine = "numpy"        # 其余键: grid, neighbors, kernel, workers, lod_ms, tick_rate
+
+    [boids]
+    count = 3000
+    max_speed = 5.0         # 其余键: max_force, perception, size, max_trail, fov_angle,
+                            # threat_radius, flee_weight, threat_separation_weight, lookahead
+
+    [weights]
+    separation = 2.0        # 其余键: align, cohesion
+
+    [predators]
+    count = 1               # 其余键: max_speed, max_force, perception, size, claim
+
+    [obstacles]
+    count = 4               # 随机障碍物
+    layout = [[400, 300, 40], [1200, 600, 30]]
+
+    [[spawns]]              # 第 600 步在 (100, 100) 生成 2 个捕食者，省略坐标时随机
+    step = 600
+    x = 100
+    y = 100
+    count = 2
+"""
+import dataclasses
+import json
+import os
+from dataclasses import dataclass
+from settings import *
+from simulation import Simulation, ENGINES, GRID_BACKENDS
+from neighbors import INDEX_BACKENDS
+from lod import LODScheduler
+
+try:
+    import tomllib
+except ImportError:
+    tomllib = None
+
+# 可选的规则力内核
+KERNELS = ("numpy", "numba")
+
+
+class ScenarioError(ValueError):
+    """场景文件格式错误或取值不合法"""
+
+
+@dataclass(frozen=True)
+class Species:
+    """一类实体的运动参数，对应 settings 中的 BOID_DEFAULTS / PREDATOR_DEFAULTS
+
+    max_trail 之后的字段只对Boid有效：视野、威胁感知半径、逃跑时的权重和避障前瞻时间。
+    """
+    max_speed: float
+    max_force: float
+    perception: float
+    size: float
+    max_trail: int = 0
+    fov_angle: float = BOID_FOV_ANGLE
+    threat_radius: float = THREAT_AWARENESS_RADIUS
+    flee_weight: float = FLEE_WEIGHT_MULTIPLIER
+    threat_separation_weight: float = SEPARATION_THREAT_MULTIPLIER
+    lookahead: float = PREDICTION_FACTOR
+
+    def __post_init__(self):
+        for field in ("max_speed", "max_force", "perception", "size", "threat_radius"):
+            if getattr(self, field) <= 0:
+                raise ScenarioError(f"{field} 必须为正数")
+        for field in ("max_trail", "flee_weight", "threat_separation_weight", "lookahead"):
+            if getattr(self, field) < 0:
+                raise ScenarioError(f"{field} 不能为负数")
+        if not 0 < self.fov_angle <= 360:
+            raise ScenarioError(f"fov_angle 必须在 (0, 360] 内，实际为 {self.fov_angle}")
+
+    def as_dict(self):
+        return dataclasses.asdict(self)
+
+
+@dataclass(frozen=True)
+class PredatorSpawn:
+    """在第 step 步结束时生成 count 个捕食者；x、y 为 None 时随机放置"""
+    step: int
+    x: float = None
+    y: float = None
+    count: int = 1
+
+    def __post_init__(self):
+        if self.step < 1:
+            raise ScenarioError(f"生成事件的 step 必须 >= 1，实际为 {self.step}")
+        if self.count < 1:
+            raise ScenarioError(f"生成事件的 count 必须 >= 1，实际为 {self.count}")
+
+
+@dataclass(frozen=True)
+class Scenario:
+    """校验过的不可变场景配置，默认值取自 settings"""
+    name: str = "default"
+    seed: int = SEED
+    steps: int = 1000
+    width: int = WIDTH
+    height: int = HEIGHT
+    boids: int = INITIAL_BOIDS
+    predators: int = INITIAL_PREDATORS
+    obstacles: int = INITIAL_OBSTACLES
+    obstacle_layout: tuple = ()
+    boid: Species = Species(**BOID_DEFAULTS)
+    predator: Species = Species(**PREDATOR_DEFAULTS)
+    align_weight: float = ALIGN_WEIGHT
+    cohesion_weight: float = COHESION_WEIGHT
+    separation_weight: float = SEPARATION_WEIGHT
+    predator_claim: bool = PREDATOR_TARGET_CLAIM
+    spawns: tuple = ()
+    engine: str = "numpy"
+    grid_backend: str = GRID_BACKEND
+    neighbor_backend: str = NEIGHBOR_BACKEND
+    kernel: str = FLOCK_KERNEL
+    workers: int = PARALLEL_WORKERS
+    lod_ms: float = LOD_TARGET_MS
+    # 模拟每秒的步数；steps 和生成事件的 step 仍按步数计
+    tick_rate: int = SIM_TICK_RATE
+
+    def __post_init__(self):
+        if self.width <= 0 or self.height <= 0:
+            raise ScenarioError(f"世界大小必须为正数，实际为 {self.width}x{self.height}")
+        for field in ("steps", "boids", "predators", "obstacles", "workers"):
+            if getattr(self, field) < 0:
+                raise ScenarioError(f"{field} 不能为负数")
+        if self.tick_rate <= 0:
+            raise ScenarioError(f"tick_rate 必须为正数，实际为 {self.tick_rate}")
+        for field, value, choices in (("engine", self.engine, ENGINES),
+                                      ("grid", self.grid_backend, GRID_BACKENDS),
+                                      ("neighbors", self.neighbor_backend, INDEX_BACKENDS),
+                                      ("kernel", self.kernel, KERNELS)):
+            if value not in choices:
+                raise ScenarioError(f"未知的 {field}: {value!r}，可选 {choices}")
+        for x, y, radius in self.obstacle_layout:
+            if radius <= 0:
+                raise ScenarioError(f"障碍物半径必须为正数: {(x, y, radius)}")
+        if self.boid.perception > min(self.width, self.height) / 2:
+            raise ScenarioError("Boid的 perception 不能超过世界短边的一半")
+
+    @property
+    def sim_params(self):
+        return {
+            "align_weight": self.align_weight,
+            "cohesion_weight": self.cohesion_weight,
+            "separation_weight": self.separation_weight,
+        }
+
+    def replace(self, **changes):
+        """返回修改了部分字段的新场景（重新校验）"""
+        return dataclasses.replace(self, **changes)
+
+
+# 文件中各表允许的键 -> Scenario 字段
+_TABLES = {
+    None: {"name": "name", "seed": "seed", "steps": "steps"},
+    "world": {"width": "width", "height": "height"},
+    "engine": {"engine": "engine", "grid": "grid_backend", "neighbors": "neighbor_backend",
+               "kernel": "kernel", "workers": "workers", "lod_ms": "lod_ms",
+               "tick_rate": "tick_rate"},
+    "weights": {"align": "align_weight", "cohesion": "cohesion_weight",
+                "separation": "separation_weight"},
+}
+_SPECIES_KEYS = ("max_speed", "max_force", "perception", "size")
+# 只能在 [boids] 中设置的键
+_BOID_KEYS = ("max_trail", "fov_angle", "threat_radius", "flee_weight",
+              "threat_separation_weight", "lookahead")
+_TYPES = {
+    "name": str, "seed": (int, type(None)), "steps": int, "width": int, "height": int,
+    "engine": str, "grid_backend": str, "neighbor_backend": str, "kernel": str,
+    "workers": int, "lod_ms": (int, float), "tick_rate": int, "align_weight": (int, float),
+    "cohesion_weight": (int, float), "separation_weight": (int, float),
+}
+
+
+def _check_keys(table, data, allowed):
+    if not isinstance(data, dict):
+        raise ScenarioError(f"[{table}] 必须是表")
+    unknown = set(data) - set(allowed)
+    if unknown:
+        raise ScenarioError(f"[{table}] 中未知的键: {sorted(unknown)}，可选 {sorted(allowed)}")
+
+
+def _check_type(key, value, expected):
+    # bool 是 int 的子类，需要单独排除
+    if isinstance(value, bool) or not isinstance(value, expected):
+        raise ScenarioError(f"{key} 的类型错误: {value!r}")
+    return value
+
+
+def _species(table, data, base, counts):
+    allowed = _SPECIES_KEYS + _BOID_KEYS if table == "boids" else _SPECIES_KEYS
+    extra = ("count", "claim") if table == "predators" else ("count",)
+    _check_keys(table, data, allowed + extra)
+    params = base.as_dict()
+    for key in allowed:
+        if key in data:
+            params[key] = _check_type(f"{table}.{key}", data[key],
+                                      int if key == "max_trail" else (int, float))
+    if "count" in data:
+        counts["boids" if table == "boids" else "predators"] = _check_type(
+            f"{table}.count", data["count"], int)
+    return Species(**params)
+
+
+def parse_scenario(data, name="scenario"):
+    """把解析后的字典转换为 Scenario，任何不合法的内容都抛出 ScenarioError"""
+    tables = set(_TABLES) - {None}
+    _check_keys(name, data, set(_TABLES[None]) | tables | {"boids", "predators", "obstacles",
+                                                           "spawns"})
+    fields = {"name": name}
+    for table, keys in _TABLES.items():
+        section = data if table is None else data.get(table, {})
+        if table is not None:
+            _check_keys(table, section, keys)
+        for key, field in keys.items():
+            if key in section:
+                fields[field] = _check_type(key, section[key], _TYPES[field])
+
+    default = Scenario()
+    fields["boid"] = _species("boids", data.get("boids", {}), default.boid, fields)
+    fields["predator"] = _species("predators", data.get("predators", {}), default.predator, fields)
+    if "claim" in data.get("predators", {}):
+        claim = data["predators"]["claim"]
+        if not isinstance(claim, bool):
+            raise ScenarioError(f"predators.claim 的类型错误: {claim!r}")
+        fields["predator_claim"] = claim
+
+    obstacles = data.get("obstacles", {})
+    _check_keys("obstacles", obstacles, ("count", "layout"))
+    if "count" in obstacles:
+        fields["obstacles"] = _check_type("obstacles.count", obstacles["count"], int)
+    layout = []
+    for item in obstacles.get("layout", []):
+        if not isinstance(item, (list, tuple)) or len(item) != 3:
+            raise ScenarioError(f"obstacles.layout 的每项必须是 [x, y, radius]: {item!r}")
+        layout.append(tuple(_check_type("obstacles.layout", value, (int, float))
+                            for value in item))
+    fields["obstacle_layout"] = tuple(layout)
+
+    spawns = data.get("spawns", [])
+    if not isinstance(spawns, list):
+        raise ScenarioError("spawns 必须是表的数组 ([[spawns]])")
+    events = []
+    for spawn in spawns:
+        _check_keys("spawns", spawn, ("step", "x", "y", "count"))
+        if "step" not in spawn:
+            raise ScenarioError(f"生成事件缺少 step: {spawn!r}")
+        if ("x" in spawn) != ("y" in spawn):
+            raise ScenarioError(f"生成事件的 x 和 y 必须同时给出: {spawn!r}")
+        events.append(PredatorSpawn(
+            _check_type("spawns.step", spawn["step"], int),
+            _check_type("spawns.x", spawn["x"], (int, float)) if "x" in spawn else None,
+            _check_type("spawns.y", spawn["y"], (int, float)) if "y" in spawn else None,
+            _check_type("spawns.count", spawn.get("count", 1), int)))
+    fields["spawns"] = tuple(sorted(events, key=lambda event: event.step))
+    return Scenario(**fields)
+
+
+def load_scenario(path):
+    """读取 .toml 或 .json 场景文件"""
+    name, ext = os.path.splitext(os.path.basename(path))
+    if ext == ".toml":
+        if tomllib is None:
+            raise ScenarioError("读取 TOML 场景需要 Python 3.11+ (tomllib)，或改用 JSON")
+        with open(path, "rb") as f:
+            try:
+                data = tomllib.load(f)
+            except tomllib.TOMLDecodeError as e:
+                raise ScenarioError(f"{path}: {e}") from None
+    elif ext == ".json":
+        with open(path, encoding="utf-8") as f:
+            try:
+                data = json.load(f)
+            except json.JSONDecodeError as e:
+                raise ScenarioError(f"{path}: {e}") from None
+    else:
+        raise ScenarioError(f"{path}: 场景文件必须是 .toml 或 .json")
+    try:
+        return parse_scenario(data, name)
+    except ScenarioError as e:
+        raise ScenarioError(f"{path}: {e}") from None
+
+
+class PredatorSpawner:
+    """按场景的生成事件在指定步数添加捕食者，作为观察者挂在 Simulation 上"""
+
+    def __init__(self, spawns):
+        self.spawns = {}
+        for spawn in spawns:
+            self.spawns.setdefault(spawn.step, []).append(spawn)
+
+    def on_step(self, sim):
+        for spawn in self.spawns.get(sim.steps, ()):
+            for _ in range(spawn.count):
+                if spawn.x is None:
+                    x, y = sim.rng.randint(0, sim.width), sim.rng.randint(0, sim.height)
+                else:
+                    x, y = spawn.x, spawn.y
+                sim.add_predator(x, y)
+
+
+def create_simulation(scenario):
+    """按场景创建模拟世界"""
+    sim = Simulation(scenario.boids, scenario.predators, scenario.obstacles,
+                     seed=scenario.seed, engine=scenario.engine,
+                     grid_backend=scenario.grid_backend,
+                     neighbor_backend=scenario.neighbor_backend, kernel=scenario.kernel,
+                     workers=scenario.workers, width=scenario.width, height=scenario.height,
+                     boid_defaults=scenario.boid.as_dict(),
+                     predator_defaults=scenario.predator.as_dict(),
+                     obstacle_layout=scenario.obstacle_layout, tick_rate=scenario.tick_rate)
+    sim.scenario = scenario
+    sim.sim_params.update(scenario.sim_params)
+    sim.predator_claim = scenario.predator_claim
+    # LOD 调度只作用于批量引擎
+    sim.lod = (LODScheduler(scenario.lod_ms)
+               if scenario.lod_ms > 0 and scenario.engine == "numpy" else None)
+    if scenario.spawns:
+        sim.add_observer(PredatorSpawner(scenario.spawns).on_step)
+    return sim
@@ -1,6 +1,9 @@
 # 屏幕设置
 WIDTH, HEIGHT = 1200, 800
-FPS = 60
+FPS = 60  # 绘制帧率上限
+SIM_TICK_RATE = 60  # 模拟每秒的步数，与绘制帧率无关
+MAX_CATCH_UP_STEPS = 5  # 每个绘制帧最多运行的模拟步数
+FRAME_SKIP_POLICY = "drop"  # 追赶不及时: "drop" 丢弃积压, "carry" 留到之后的帧
 
 # 颜色定义
 BACKGROUND = (10, 20, 30)
@@ -38,7 +41,12 @@ BOID_DEFAULTS = {
     "max_force": 0.2,
     "perception": 70,
     "size": 6,
-    "max_trail": 10
+    "max_trail": 10,
+    "fov_angle": BOID_FOV_ANGLE,
+    "threat_radius": THREAT_AWARENESS_RADIUS,
+    "flee_weight": FLEE_WEIGHT_MULTIPLIER,
+    "threat_separation_weight": SEPARATION_THREAT_MULTIPLIER,
+    "lookahead": PREDICTION_FACTOR,
 }
 
 # Predator默认参数
@@ -48,9 +56,46 @@ PREDATOR_DEFAULTS = {
     "perception": 180,
     "size": 10
 }
+PREDATOR_TARGET_CLAIM = False  # 捕食者是否互相认领目标，避免成群追同一只Boid
 
 # 性能优化
 GRID_CELL_SIZE = 80  # 空间分区网格大小
+GRID_BACKEND = "lists"  # 网格实现: "lists" (SpatialGrid)，或下面任一邻居索引
+NEIGHBOR_BACKEND = "auto"  # Boid邻居索引: "csr" (CellGrid), "kdtree" (需要scipy), "auto"
+AUTO_SKEW_THRESHOLD = 8.0  # auto 模式下切换到KD树的网格占用偏斜度阈值
+OBSTACLE_CELL_SIZE = 40  # 障碍物索引的单元格大小
+FLOCK_KERNEL = "numpy"  # 规则力计算: "numpy" 或 "numba"（未安装numba时自动回退）
+PARALLEL_WORKERS = 0  # 并行引擎的工作进程数，0 表示使用全部CPU核
+RENDER_MODE = "sprites"  # 绘制模式: "sprites" (预旋转精灵批量blit) 或 "pixels" (直接写像素)
+RENDER_ANGLE_BUCKETS = 64  # 精灵预旋转的朝向数量
+FORCE_FIELD_SPACING = 40  # 力场可视化的采样点间距
+FORCE_FIELD_BLUR = 1  # 力场平滑半径（采样格数），0 表示不平滑
+FORCE_FIELD_CACHE_FRAMES = 3  # 力场每隔多少帧重新计算一次
+TEXT_CACHE_SIZE = 256  # 文字表面缓存的最大条目数
+PROFILER_WINDOW = 240  # 性能面板统计分位数时保留的最近帧数
+LOD_TARGET_MS = 0  # 行为力计算的每步时间预算（毫秒），超出时轮流只更新部分Boid；0 表示关闭
+LOD_MAX_INTERVAL = 8  # 普通Boid最多每隔多少步更新一次行为力
+LOD_PREDATOR_RADIUS = 270  # 捕食者周围此范围内的Boid每步都更新
+
+# 随机种子，None 表示每次运行都不同
+SEED = None
+# 快照文件路径 (F5 保存, F9 读取)
+SNAPSHOT_PATH = "boids.snap"
+
+# 轨迹录制
+RECORD_FIELDS = ("pos", "vel", "state", "is_leader", "predators", "obstacles")
+RECORD_EVERY = 1  # 每隔多少步录制一帧
+RECORD_CHUNK_FRAMES = 256  # 每个数据块包含的帧数
+RECORD_CODEC = "auto"  # "auto" (zstd > lz4 > zlib), "zstd", "lz4", "zlib", "none" (可内存映射的 .npy)
+RECORD_QUEUE_SIZE = 64  # 后台写入队列的容量，满时丢帧
+RECORD_FLOAT_DTYPE = "float32"  # 录制位置/速度使用的浮点类型
+REPLAY_CACHE_CHUNKS = 4  # 回放时缓存的数据块数量
+REPLAY_MAX_SPEED = 64  # 回放的最大倍速
+
+# 模拟工作进程 (main.py --worker)：共享帧缓冲的容量，超出部分不绘制
+WORKER_MAX_BOIDS = 20000
+WORKER_MAX_PREDATORS = 64
+WORKER_MAX_OBSTACLES = 256
 
 # 初始数量
 INITIAL_BOIDS = 120
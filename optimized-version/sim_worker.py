@@ -0,0 +1,301 @@
+import multiprocessing
+import queue
+import sys
+import time
+from multiprocessing import shared_memory
+import numpy as np
+from settings import *
+from flock import obstacle_array, predator_array
+from replay import ReplayWorld
+from scenario import Scenario, create_simulation
+from timestep import FixedTimestep
+from utils import SpatialGrid
+
+# 帧缓冲槽位数：写入方总能找到一个既不是最新帧、也不在被读取的槽位
+FRAME_SLOTS = 3
+# 每个槽位头部的字段
+SEQ, FRAME, STEPS, N_BOIDS, N_PREDATORS, N_OBSTACLES, PAUSED = range(7)
+# 控制区：最新完整帧所在的槽位，以及绘制进程正在读取的槽位
+LATEST, READING = range(2)
+ALIGNMENT = 64
+# 工作进程接受的命令；除 pause 和 quit 外都调用 Simulation 的同名方法
+COMMANDS = ("add_obstacle", "add_predator", "reset", "restart", "set_param",
+            "save_snapshot", "load_snapshot", "pause", "quit")
+
+
+def _layout(max_boids, max_predators, max_obstacles):
+    """共享内存中每个数组的 (名称, 形状, dtype)，两个进程按同一布局映射"""
+    slots = FRAME_SLOTS
+    return (
+        ("control", (2,), np.int64),
+        ("header", (slots, 7), np.int64),
+        ("params", (slots, 3), np.float64),
+        ("pos", (slots, max_boids, 2), np.float64),
+        ("vel", (slots, max_boids, 2), np.float64),
+        ("is_leader", (slots, max_boids), np.bool_),
+        ("predators", (slots, max_predators, 4), np.float64),
+        ("obstacles", (slots, max_obstacles, 3), np.float64),
+    )
+
+
+# 帧中的参数顺序
+PARAM_NAMES = ("align_weight", "cohesion_weight", "separation_weight")
+
+
+class FrameBuffers:
+    """三缓冲的共享内存帧，每个槽位用序列锁 (seqlock) 保护
+
+    写入方把新帧写进一个空闲槽位：先把序号加一（奇数表示正在写），写完再加一，
+    最后把控制区的 LATEST 指向该槽位。读取方复制 LATEST 槽位的数据，复制前后
+    序号相同且为偶数才算读到完整的帧，否则重试。两边都不加锁，模拟和绘制互不等待。
+    """
+
+    def __init__(self, max_boids=WORKER_MAX_BOIDS, max_predators=WORKER_MAX_PREDATORS,
+                 max_obstacles=WORKER_MAX_OBSTACLES, name=None):
+        self.capacity = (max_boids, max_predators, max_obstacles)
+        layout = _layout(*self.capacity)
+        offsets = []
+        size = 0
+        for _, shape, dtype in layout:
+            offsets.append(size)
+            size += -(-int(np.prod(shape)) * np.dtype(dtype).itemsize // ALIGNMENT) * ALIGNMENT
+        self.owner = name is None
+        if self.owner:
+            self.shm = shared_memory.SharedMemory(create=True, size=size)
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+        for (field, shape, dtype), offset in zip(layout, offsets):
+            setattr(self, field, np.ndarray(shape, dtype=dtype, buffer=self.shm.buf, offset=offset))
+        if self.owner:
+            self.control[:] = (-1, -1)
+            self.header[:] = 0
+        # 已发布的帧数，帧号用于区分步数相同的帧（例如暂停时增加了障碍物）
+        self.frames = 0
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    def publish(self, sim, paused=False):
+        """把模拟世界的当前状态写入空闲槽位并设为最新帧"""
+        control = self.control
+        busy = (int(control[LATEST]), int(control[READING]))
+        slot = next(s for s in range(FRAME_SLOTS) if s not in busy)
+        max_boids, max_predators, max_obstacles = self.capacity
+        flock = sim.flock
+        n = min(flock.n, max_boids)
+        predators = predator_array(sim.predators)[:max_predators]
+        predator_vel = np.array([predator.velocity for predator in sim.predators],
+                                dtype=float).reshape(-1, 2)[:max_predators]
+        obstacles = obstacle_array(sim.obstacles)[:max_obstacles]
+
+        header = self.header[slot]
+        header[SEQ] += 1
+        self.pos[slot, :n] = flock.pos[:n]
+        self.vel[slot, :n] = flock.vel[:n]
+        self.is_leader[slot, :n] = flock.is_leader[:n]
+        self.predators[slot, :len(predators), :2] = predators
+        self.predators[slot, :len(predators), 2:] = predator_vel
+        self.obstacles[slot, :len(obstacles)] = obstacles
+        self.params[slot] = [sim.sim_params[name] for name in PARAM_NAMES]
+        self.frames += 1
+        header[FRAME:] = (self.frames, sim.steps, n, len(predators), len(obstacles), paused)
+        header[SEQ] += 1
+        control[LATEST] = slot
+
+    def read(self, retries=100):
+        """复制最新的完整帧，返回帧字典；还没有帧时返回 None"""
+        control = self.control
+        for _ in range(retries):
+            slot = int(control[LATEST])
+            if slot < 0:
+                return None
+            control[READING] = slot
+            header = self.header[slot]
+            seq = int(header[SEQ])
+            if seq % 2:
+                continue
+            _, frame_id, steps, n, n_predators, n_obstacles, paused = header.tolist()
+            frame = {
+                "frame": frame_id,
+                "step": steps,
+                "paused": bool(paused),
+                "pos": np.array(self.pos[slot, :n]),
+                "vel": np.array(self.vel[slot, :n]),
+                "is_leader": np.array(self.is_leader[slot, :n]),
+                "predators": np.array(self.predators[slot, :n_predators]),
+                "obstacles": np.array(self.obstacles[slot, :n_obstacles]),
+                "params": dict(zip(PARAM_NAMES, self.params[slot].tolist())),
+            }
+            if int(header[SEQ]) == seq:
+                control[READING] = -1
+                return frame
+        control[READING] = -1
+        return None
+
+    def close(self):
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
+
+
+def _run_worker(shm_name, capacity, commands, scenario, policy):
+    """工作进程主循环：执行命令、按固定步长推进模拟并发布帧"""
+    buffers = FrameBuffers(*capacity, name=shm_name)
+    sim = create_simulation(scenario)
+    timestep = FixedTimestep(scenario.tick_rate, policy=policy)
+    paused = False
+    buffers.publish(sim, paused)
+    last_time = time.perf_counter()
+    try:
+        while True:
+            # 没有要运行的步时阻塞在命令队列上，直到下一步的时间；暂停时一直等到有命令
+            try:
+                if paused:
+                    command = commands.get()
+                else:
+                    wait = timestep.dt - timestep.accumulator
+                    command = commands.get(timeout=wait) if wait > 0 else commands.get_nowait()
+            except queue.Empty:
+                command = None
+            changed = False
+            while command is not None:
+                action, *args = command
+                if action == "quit":
+                    return
+                if action == "pause":
+                    if paused and not args[0]:
+                        # 暂停期间经过的时间不计入累加器
+                        timestep.reset()
+                        last_time = time.perf_counter()
+                    paused = args[0]
+                else:
+                    try:
+                        getattr(sim, action)(*args)
+                    except (OSError, ValueError) as e:
+                        # 例如读取不存在的快照：只报告，工作进程继续运行
+                        print(f"命令 {action} 失败: {e}", file=sys.stderr)
+                changed = True
+                try:
+                    command = commands.get_nowait()
+                except queue.Empty:
+                    command = None
+
+            now = time.perf_counter()
+            elapsed = now - last_time
+            last_time = now
+            steps = 0 if paused else timestep.advance(elapsed)
+            sim.step(steps)
+            if steps or changed:
+                buffers.publish(sim, paused)
+    finally:
+        sim.close()
+        buffers.close()
+
+
+class WorkerError(RuntimeError):
+    """模拟工作进程意外退出"""
+
+
+class SimulationWorker:
+    """在独立进程中运行的模拟，绘制进程只读取最新的完整帧
+
+    输入事件通过 multiprocessing.Queue 以命令的形式发给工作进程，put_nowait 不会
+    等待模拟；模拟状态经 FrameBuffers 共享。提供与 Simulation 相同的 flock、
+    predators、obstacles、boids、sim_params 和 grid 属性，绘制代码无需区分。
+    轨迹不在进程间传递，工作进程模式下不绘制轨迹。
+    """
+
+    def __init__(self, scenario=None, policy=FRAME_SKIP_POLICY,
+                 max_boids=WORKER_MAX_BOIDS, max_predators=WORKER_MAX_PREDATORS,
+                 max_obstacles=WORKER_MAX_OBSTACLES):
+        scenario = Scenario() if scenario is None else scenario
+        self.buffers = FrameBuffers(max_boids, max_predators, max_obstacles)
+        # spawn 启动的进程不继承 pygame 的显示状态
+        context = multiprocessing.get_context("spawn")
+        self.commands = context.Queue()
+        self.process = context.Process(
+            target=_run_worker, name="simulation-worker", daemon=True,
+            args=(self.buffers.name, self.buffers.capacity, self.commands, scenario, policy))
+        self.process.start()
+        self.world = ReplayWorld(scenario.boid.as_dict(), scenario.predator.as_dict())
+        self.world.load({"pos": np.zeros((0, 2))})
+        self.grid = SpatialGrid(scenario.width, scenario.height, GRID_CELL_SIZE)
+        self.sim_params = scenario.sim_params
+        self.frame = 0
+        self.steps = 0
+        self.paused = False
+
+    @property
+    def flock(self):
+        return self.world.flock
+
+    @property
+    def predators(self):
+        return self.world.predators
+
+    @property
+    def obstacles(self):
+        return self.world.obstacles
+
+    @property
+    def boids(self):
+        return range(self.world.flock.n)
+
+    def poll(self):
+        """取最新的完整帧，有新帧时返回 True；工作进程已退出时抛出 WorkerError"""
+        if not self.process.is_alive():
+            raise WorkerError(f"模拟工作进程已退出（退出码 {self.process.exitcode}）")
+        frame = self.buffers.read()
+        if frame is None or frame["frame"] == self.frame:
+            return False
+        self.world.load(frame)
+        self.frame = frame["frame"]
+        self.steps = frame["step"]
+        self.paused = frame["paused"]
+        self.sim_params.update(frame["params"])
+        return True
+
+    def send(self, action, *args):
+        if action not in COMMANDS:
+            raise ValueError(f"未知的命令: {action!r}，可选 {COMMANDS}")
+        self.commands.put_nowait((action, *args))
+
+    def add_obstacle(self, x, y, radius=None):
+        self.send("add_obstacle", x, y, radius)
+
+    def add_predator(self, x, y):
+        self.send("add_predator", x, y)
+
+    def reset(self, n_boids=INITIAL_BOIDS, n_predators=0, n_obstacles=0):
+        self.send("reset", n_boids, n_predators, n_obstacles)
+
+    def restart(self):
+        self.send("restart")
+
+    def set_param(self, name, value):
+        # 本地先更新，连续按键时基于最新的值调整
+        self.sim_params[name] = value
+        self.send("set_param", name, value)
+
+    def save_snapshot(self, path=SNAPSHOT_PATH):
+        self.send("save_snapshot", path)
+
+    def load_snapshot(self, path=SNAPSHOT_PATH):
+        self.send("load_snapshot", path)
+
+    def pause(self, paused):
+        self.send("pause", paused)
+
+    def close(self):
+        """通知工作进程退出并释放共享内存"""
+        if self.process is None:
+            return
+        self.send("quit")
+        self.process.join(timeout=5)
+        if self.process.is_alive():
+            self.process.terminate()
+            self.process.join()
+        self.process = None
+        self.commands.close()
+        self.buffers.close()
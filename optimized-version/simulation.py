@@ -0,0 +1,245 @@
+import hashlib
+import random
+from contextlib import nullcontext
+import numpy as np
+from settings import *
+from flock import FlockArrays, lerp_positions, obstacle_array, predator_array
+from obstacle_field import ObstacleField
+from entities.predator import Predator
+from entities.obstacle import Obstacle
+from utils import SpatialGrid
+from neighbors import INDEX_BACKENDS, create_index
+from parallel import ParallelStepper
+from lod import LODScheduler
+import snapshot
+
+# 可选的更新引擎："numpy" 为批量数组运算，"parallel" 为多进程并行的批量运算，
+# "objects" 为逐个Boid对象计算
+ENGINES = ("numpy", "parallel", "objects")
+# 可选的空间网格实现："lists" 为 SpatialGrid，其余为 neighbors 中的邻居索引
+GRID_BACKENDS = ("lists",) + INDEX_BACKENDS
+
+
+class Simulation:
+    """不依赖显示窗口的模拟世界，持有所有实体、空间网格和模拟参数"""
+
+    def __init__(self, n_boids=INITIAL_BOIDS, n_predators=INITIAL_PREDATORS,
+                 n_obstacles=INITIAL_OBSTACLES, seed=SEED, engine="numpy",
+                 grid_backend=GRID_BACKEND, neighbor_backend=NEIGHBOR_BACKEND,
+                 kernel=FLOCK_KERNEL, workers=PARALLEL_WORKERS, width=WIDTH, height=HEIGHT,
+                 boid_defaults=BOID_DEFAULTS, predator_defaults=PREDATOR_DEFAULTS,
+                 obstacle_layout=(), tick_rate=SIM_TICK_RATE):
+        if engine not in ENGINES:
+            raise ValueError(f"未知的引擎: {engine!r}，可选 {ENGINES}")
+        if grid_backend not in GRID_BACKENDS:
+            raise ValueError(f"未知的网格实现: {grid_backend!r}，可选 {GRID_BACKENDS}")
+        # 每个模拟独立的随机数生成器，相同种子得到逐位相同的运行结果
+        self.seed = seed
+        self.rng = random.Random(seed)
+        self.engine = engine
+        self.neighbor_backend = neighbor_backend
+        self.kernel = kernel
+        self.workers = workers
+        self.stepper = None
+        self.width = width
+        self.height = height
+        # 模拟每秒的步数，决定每步积分的时间
+        self.tick_rate = tick_rate
+        # Boid和捕食者的参数（max_speed、perception 等），创建实体时传入
+        self.boid_defaults = dict(boid_defaults)
+        self.predator_defaults = dict(predator_defaults)
+        # 由 scenario.create_simulation 设置，restart 按场景重新生成实体
+        self.scenario = None
+        self.sim_params = {
+            "align_weight": ALIGN_WEIGHT,
+            "cohesion_weight": COHESION_WEIGHT,
+            "separation_weight": SEPARATION_WEIGHT,
+        }
+        if grid_backend == "lists":
+            self.grid = SpatialGrid(width, height, GRID_CELL_SIZE)
+        else:
+            self.grid = create_index(grid_backend, width, height, GRID_CELL_SIZE)
+        # 为 True 时捕食者互相认领目标，不会全部追同一只Boid
+        self.predator_claim = PREDATOR_TARGET_CLAIM
+        # 可选的 LODScheduler，批量引擎按时间预算轮流只更新部分Boid的行为力
+        self.lod = LODScheduler() if LOD_TARGET_MS > 0 else None
+        self.steps = 0
+        # 可选的 FrameProfiler，设置后按阶段记录每一步的耗时
+        self.profiler = None
+        # 每步结束后调用的观察者，参数为模拟世界本身（例如轨迹录制器）
+        self.observers = []
+        self.reset(n_boids, n_predators, n_obstacles, obstacle_layout)
+
+    def reset(self, n_boids=INITIAL_BOIDS, n_predators=0, n_obstacles=0, obstacle_layout=()):
+        """重新生成所有实体，并随机指定一只领导者
+
+        obstacle_layout 为固定障碍物的 (x, y, radius) 列表，放在随机障碍物之前。
+        """
+        self.flock = FlockArrays.random(n_boids, self.width, self.height,
+                                        backend=self.neighbor_backend, kernel=self.kernel,
+                                        rng=self.rng, defaults=self.boid_defaults,
+                                        tick_rate=self.tick_rate)
+        self.boids = self.flock.boids
+        self.predators = []
+        self.obstacles = []
+        # 障碍物的静态索引，只在增删障碍物时重建
+        self.obstacle_field = ObstacleField(reach=self.boid_defaults["size"] * 5)
+        self._prev_predator_pos = np.zeros((0, 2))
+        for x, y, radius in obstacle_layout:
+            self.add_obstacle(x, y, radius)
+        for _ in range(n_predators):
+            self.add_predator(self.rng.randint(0, self.width), self.rng.randint(0, self.height))
+        for _ in range(n_obstacles):
+            self.add_obstacle(self.rng.randint(0, self.width), self.rng.randint(0, self.height))
+        if self.boids:
+            self.rng.choice(self.boids).is_leader = True
+        self.grid.clear()
+        for boid in self.boids:
+            self.grid.add(boid)
+        if self.engine == "parallel":
+            if self.stepper is None:
+                self.stepper = ParallelStepper(self.flock, self.workers)
+            else:
+                self.stepper.attach(self.flock)
+
+    def restart(self):
+        """从第 0 步重新开始：有场景时按场景重新生成实体，否则按默认数量"""
+        scenario = self.scenario
+        self.steps = 0
+        if scenario is None:
+            self.reset(INITIAL_BOIDS)
+        else:
+            self.reset(scenario.boids, scenario.predators, scenario.obstacles,
+                       scenario.obstacle_layout)
+
+    def close(self):
+        """释放并行引擎占用的进程池和共享内存"""
+        if self.stepper is not None:
+            self.stepper.close()
+            self.stepper = None
+
+    @property
+    def leader(self):
+        return next((boid for boid in self.boids if boid.is_leader), None)
+
+    def set_param(self, name, value):
+        if name not in self.sim_params:
+            raise ValueError(f"未知的模拟参数: {name!r}，可选 {tuple(self.sim_params)}")
+        self.sim_params[name] = value
+
+    def add_predator(self, x, y):
+        predator = Predator(x, y, self.rng, self.predator_defaults, self.width, self.height,
+                            self.tick_rate)
+        self.predators.append(predator)
+        return predator
+
+    def add_obstacle(self, x, y, radius=None):
+        if radius is None:
+            radius = self.rng.randint(20, 50)
+        obstacle = Obstacle(x, y, radius)
+        self.obstacles.append(obstacle)
+        self.obstacles_changed()
+        return obstacle
+
+    def remove_obstacle(self, obstacle):
+        self.obstacles.remove(obstacle)
+        self.obstacles_changed()
+
+    def obstacles_changed(self):
+        """直接修改 self.obstacles 后调用，重建障碍物索引"""
+        self.obstacle_field.rebuild(obstacle_array(self.obstacles))
+
+    def step(self, n=1):
+        """推进 n 个模拟步"""
+        for _ in range(n):
+            self._step()
+
+    def state_hash(self):
+        """整个世界状态的哈希值，用于比较不同运行（串行/并行引擎）是否逐位一致"""
+        flock = self.flock
+        n = flock.n
+        digest = hashlib.sha256()
+        digest.update(np.int64([self.steps, n, len(self.predators), len(self.obstacles)]).tobytes())
+        for array in (flock.pos, flock.vel, flock.state, flock.is_leader, flock.leader_target):
+            digest.update(np.ascontiguousarray(array[:n]).tobytes())
+        for predator in self.predators:
+            digest.update(np.float64([*predator.position, *predator.velocity]).tobytes())
+        for obstacle in self.obstacles:
+            digest.update(np.float64([*obstacle.position, obstacle.radius]).tobytes())
+        return digest.hexdigest()
+
+    def add_observer(self, observer):
+        self.observers.append(observer)
+
+    def remove_observer(self, observer):
+        self.observers.remove(observer)
+
+    def save_snapshot(self, path=SNAPSHOT_PATH):
+        """把整个世界（含轨迹、参数和随机数状态）保存为二进制快照"""
+        snapshot.save_snapshot(self, path)
+
+    def load_snapshot(self, path=SNAPSHOT_PATH):
+        """从快照恢复整个世界，之后的运行与保存时继续运行的结果逐位一致
+
+        启用 LOD 时更新间隔随实测耗时调整，只有之后的耗时得到相同的间隔时才逐位一致。
+        """
+        snapshot.load_snapshot(self, path)
+
+    def _phase(self, name):
+        if self.profiler is None:
+            return nullcontext()
+        return self.profiler.phase(name)
+
+    def interpolated(self, alpha):
+        """上一步与当前步之间的插值状态，返回 (Boid位置, 捕食者位置)"""
+        predator_pos = predator_array(self.predators)
+        if len(self._prev_predator_pos) == len(predator_pos):
+            predator_pos = lerp_positions(self._prev_predator_pos, predator_pos, alpha,
+                                          self.predator_defaults["max_speed"]
+                                          * self.flock.step_scale * 2)
+        return self.flock.interpolated_positions(alpha), predator_pos
+
+    def _step(self):
+        # 记录上一步的状态用于插值绘制
+        self.flock.prev_pos[:self.flock.n] = self.flock.pos[:self.flock.n]
+        self._prev_predator_pos = predator_array(self.predators)
+
+        # 1. 更新Boids
+        with self._phase("boids"):
+            if self.engine == "numpy":
+                self.flock.apply_behaviors(self.predators, self.obstacle_field, self.sim_params,
+                                           self.lod)
+                self.flock.update()
+            elif self.engine == "parallel":
+                self.stepper.step(self.predators, self.obstacle_field, self.sim_params)
+            else:
+                with self.flock.vector_cache():
+                    for boid in self.boids:
+                        # 从网格获取近邻，避免O(n^2)计算
+                        neighbors = self.grid.get_neighbors(boid, boid.perception)
+                        boid.apply_behaviors(neighbors, self.predators, self.obstacles,
+                                             self.sim_params)
+                        boid.update()
+                self.flock._advance_trail()
+
+        # 2. 增量更新空间网格，只迁移跨越单元格的Boid；
+        #    批量引擎的邻居和捕食者目标都由 flock.index 查询，只有逐对象引擎读取网格
+        if self.engine == "objects":
+            with self._phase("grid"):
+                self.grid.update_all(self.boids, self.flock.pos[:self.flock.n])
+
+        # 3. 更新捕食者
+        with self._phase("predators"):
+            if self.predators:
+                # 所有捕食者一次批量查询各自最近的Boid
+                targets = self.flock.predator_targets(predator_array(self.predators),
+                                                      self.predator_defaults["perception"],
+                                                      self.predator_claim)
+                pos = self.flock.pos
+                for predator, target in zip(self.predators, targets.tolist()):
+                    predator.pursue(pos[target] if target >= 0 else None)
+                    predator.update()
+
+        self.steps += 1
+        for observer in self.observers:
+            observer(self)
@@ -0,0 +1,173 @@
+import json
+import os
+import struct
+import numpy as np
+from entities.boid import Boid
+from entities.obstacle import Obstacle
+from flock import FlockArrays
+from neighbors import AutoIndex
+from utils import SpatialGrid
+
+# 快照文件格式:
+#   8 字节魔数 | uint32 版本号 | uint32 头部长度 | JSON 头部 | 数据区（每个数组按 64 字节对齐）
+# 头部记录标量状态（步数、模拟参数、随机数状态等）以及每个数组的 dtype/shape/偏移，
+# 读取时用 np.memmap 写时复制地映射数组，恢复的鸟群直接使用这些映射，不复制；
+# 修改只写入进程私有的页面，鸟群扩容时才复制成普通数组。保存时替换而不是覆盖文件，
+# 已加载的映射仍指向旧文件，之后覆盖同一快照不会影响已恢复的状态。
+MAGIC = b"BOIDSNAP"
+VERSION = 2
+ALIGNMENT = 64
+_PREFIX = struct.Struct("<8sII")
+
+# 保存的鸟群数组（只保存前 n 行）；steering 是 LOD 调度跳过的Boid沿用的行为力
+FLOCK_ARRAYS = ("pos", "vel", "acc", "state", "is_leader", "leader_target", "steering",
+                "trail", "trail_len")
+# 保存的 LODScheduler 状态
+LOD_STATE = ("interval", "phase", "full_ms", "updated")
+
+
+class SnapshotError(ValueError):
+    """快照文件损坏或版本不兼容"""
+
+
+def _align(offset):
+    return -(-offset // ALIGNMENT) * ALIGNMENT
+
+
+def save_snapshot(sim, path):
+    """把整个模拟世界写入二进制快照文件"""
+    flock = sim.flock
+    n = flock.n
+    arrays = {name: np.ascontiguousarray(getattr(flock, name)[:n]) for name in FLOCK_ARRAYS}
+    arrays["predators"] = np.array([(*p.position, *p.velocity, *p.acceleration)
+                                    for p in sim.predators], dtype=float).reshape(-1, 6)
+    arrays["obstacles"] = np.array([(*o.position, o.radius) for o in sim.obstacles],
+                                   dtype=float).reshape(-1, 3)
+    if isinstance(sim.grid, SpatialGrid):
+        # 单元格内的顺序决定邻居的累加顺序，按原顺序重建才能逐位复现
+        arrays["grid_order"] = np.array([boid.index for cell in sim.grid.grid for boid in cell],
+                                        dtype=np.int64)
+
+    version, internal, gauss_next = sim.rng.getstate()
+    header = {
+        "steps": sim.steps,
+        "seed": sim.seed,
+        "sim_params": sim.sim_params,
+        "rng_state": [version, list(internal), gauss_next],
+        "flock": {"n": n, "max_trail": flock.max_trail, "trail_head": flock.trail_head,
+                  "index_current": flock._index_current},
+        "arrays": {},
+    }
+    if sim.lod is not None:
+        header["lod"] = {name: getattr(sim.lod, name) for name in LOD_STATE}
+    if isinstance(flock.index, AutoIndex):
+        # 下一步选用哪种索引取决于当前索引和上一步的偏斜度
+        header["auto_index"] = {"backend": flock.index.backend,
+                                "last_skew": flock.index.last_skew}
+    # 数组偏移相对于头部之后按 ALIGNMENT 对齐的数据区起点
+    offset = 0
+    for name, array in arrays.items():
+        header["arrays"][name] = {"dtype": array.dtype.str, "shape": list(array.shape),
+                                  "offset": offset}
+        offset = _align(offset + array.nbytes)
+    encoded = json.dumps(header).encode("utf-8")
+    data_start = _align(_PREFIX.size + len(encoded))
+
+    # 先写临时文件再替换：被覆盖的文件可能正被映射（例如刚从它加载），
+    # 原地截断会使映射失效，替换后旧映射仍指向旧文件
+    temp = path + ".tmp"
+    with open(temp, "wb") as f:
+        f.write(_PREFIX.pack(MAGIC, VERSION, len(encoded)))
+        f.write(encoded)
+        for name, array in arrays.items():
+            f.seek(data_start + header["arrays"][name]["offset"])
+            f.write(array.tobytes())
+        f.truncate(data_start + offset)
+    os.replace(temp, path)
+
+
+def read_snapshot(path):
+    """读取快照头部，并以写时复制的 np.memmap 映射所有数组，返回 (header, arrays)"""
+    with open(path, "rb") as f:
+        prefix = f.read(_PREFIX.size)
+        if len(prefix) < _PREFIX.size:
+            raise SnapshotError(f"{path}: 文件过短，不是快照文件")
+        magic, version, length = _PREFIX.unpack(prefix)
+        if magic != MAGIC:
+            raise SnapshotError(f"{path}: 不是快照文件")
+        if version != VERSION:
+            raise SnapshotError(f"{path}: 不支持的快照版本 {version}（当前为 {VERSION}）")
+        header = json.loads(f.read(length).decode("utf-8"))
+    data_start = _align(_PREFIX.size + length)
+
+    arrays = {}
+    for name, spec in header["arrays"].items():
+        shape = tuple(spec["shape"])
+        dtype = np.dtype(spec["dtype"])
+        if 0 in shape:
+            # 长度为 0 的区域无法映射
+            arrays[name] = np.zeros(shape, dtype=dtype)
+        else:
+            arrays[name] = np.memmap(path, dtype=dtype, mode="c",
+                                     offset=data_start + spec["offset"], shape=shape)
+    return header, arrays
+
+
+def load_snapshot(sim, path):
+    """用快照内容就地替换模拟世界的全部状态"""
+    header, arrays = read_snapshot(path)
+    meta = header["flock"]
+    n = meta["n"]
+
+    flock = FlockArrays(capacity=1, backend=sim.neighbor_backend, kernel=sim.kernel, rng=sim.rng,
+                        width=sim.width, height=sim.height, defaults=sim.boid_defaults,
+                        tick_rate=sim.tick_rate)
+    for name in FLOCK_ARRAYS:
+        # 直接使用写时复制的映射，不复制数据
+        setattr(flock, name, arrays[name])
+    # 每步重新计算的数组不保存，只按数量分配
+    flock.threat = np.zeros((n, 2))
+    flock.prev_pos = np.array(flock.pos)
+    flock.n = n
+    flock.max_trail = meta["max_trail"]
+    flock.trail_head = meta["trail_head"]
+    flock.boids = [Boid(flock, i) for i in range(n)]
+    index = flock.index
+    if "auto_index" in header and isinstance(index, AutoIndex):
+        state = header["auto_index"]
+        index.active = index.tree if state["backend"] == "kdtree" and index.tree is not None else index.grid
+        index.last_skew = state["last_skew"]
+    if meta.get("index_current"):
+        # 保存时索引已按当前位置构建（上一步末尾捕食者查询时），同样先建好，
+        # 否则下一步多构建一次会改变自动索引的切换状态
+        if isinstance(index, AutoIndex):
+            index.rebuild(flock.pos[:n])
+        else:
+            index.build(flock.pos[:n])
+        flock._index_current = True
+    if "lod" in header and sim.lod is not None:
+        for name, value in header["lod"].items():
+            setattr(sim.lod, name, value)
+
+    sim.flock = flock
+    sim.boids = flock.boids
+    sim.steps = header["steps"]
+    sim.seed = header["seed"]
+    sim.sim_params = dict(header["sim_params"])
+    sim.predators = []
+    for x, y, vx, vy, ax, ay in arrays["predators"].tolist():
+        predator = sim.add_predator(x, y)
+        predator.velocity.update(vx, vy)
+        predator.acceleration.update(ax, ay)
+    sim.obstacles = [Obstacle(x, y, radius) for x, y, radius in arrays["obstacles"].tolist()]
+    sim.obstacles_changed()
+    # 重建捕食者时消耗了随机数，最后再恢复随机数状态
+    version, internal, gauss_next = header["rng_state"]
+    sim.rng.setstate((version, tuple(internal), gauss_next))
+
+    sim.grid.clear()
+    order = arrays["grid_order"].tolist() if "grid_order" in arrays else range(n)
+    for i in order:
+        sim.grid.add(sim.boids[i])
+    if sim.stepper is not None:
+        sim.stepper.attach(flock)
@@ -0,0 +1,50 @@
+from settings import *
+
+# 一帧内追赶不完时的处理方式："drop" 丢弃积压的时间（模拟暂时变慢），
+# "carry" 保留最多 max_steps 步的积压留到之后的帧继续追赶
+FRAME_SKIP_POLICIES = ("drop", "carry")
+
+
+class FixedTimestep:
+    """固定步长的时间累加器，使模拟速率与绘制帧率无关
+
+    每帧把真实经过的时间加入累加器，按 1 / tick_rate 的步长取出需要运行的步数；
+    一帧最多运行 max_steps 步，防止慢帧导致越追越慢。alpha 为累加器中剩余的
+    不足一步的时间比例，用于在上一步和当前步的状态之间插值绘制。
+    """
+
+    def __init__(self, tick_rate=SIM_TICK_RATE, max_steps=MAX_CATCH_UP_STEPS,
+                 policy=FRAME_SKIP_POLICY):
+        if policy not in FRAME_SKIP_POLICIES:
+            raise ValueError(f"未知的跳帧策略: {policy!r}，可选 {FRAME_SKIP_POLICIES}")
+        self.dt = 1.0 / tick_rate
+        self.max_steps = max(1, max_steps)
+        self.policy = policy
+        self.accumulator = 0.0
+        # 累计因超过追赶上限而丢弃的步数
+        self.skipped = 0
+
+    @property
+    def alpha(self):
+        return min(self.accumulator / self.dt, 1.0)
+
+    def advance(self, elapsed):
+        """加入经过的秒数，返回本帧应运行的模拟步数"""
+        self.accumulator += elapsed
+        steps = min(self._whole_steps(), self.max_steps)
+        self.accumulator -= steps * self.dt
+        if self._whole_steps():
+            if self.policy == "drop":
+                backlog = self._whole_steps()
+            else:
+                backlog = max(0, self._whole_steps() - self.max_steps)
+            self.skipped += backlog
+            self.accumulator -= backlog * self.dt
+        return steps
+
+    def _whole_steps(self):
+        # 容忍浮点累加误差，避免 4.999999 步被截成 4 步
+        return int(self.accumulator / self.dt + 1e-9)
+
+    def reset(self):
+        self.accumulator = 0.0
@@ -1,6 +1,8 @@
+import math
+from collections import OrderedDict
+import numpy as np
 import pygame
 from settings import *
-from pygame.math import Vector2
 
 def init_fonts():
     """初始化字体"""
@@ -13,28 +15,66 @@ def init_fonts():
         title_font = pygame.font.SysFont(None, TITLE_FONT_SIZE + 5)
     return font, title_font
 
+class TextCache:
+    """按 (文本, 颜色, 字体) 缓存渲染好的文字表面，超出容量时淘汰最久未用的"""
+
+    def __init__(self, maxsize=TEXT_CACHE_SIZE):
+        self.maxsize = maxsize
+        self._surfaces = OrderedDict()
+
+    def get(self, key, build):
+        surface = self._surfaces.get(key)
+        if surface is None:
+            surface = self._surfaces[key] = build()
+            if len(self._surfaces) > self.maxsize:
+                self._surfaces.popitem(last=False)
+        else:
+            self._surfaces.move_to_end(key)
+        return surface
+
+    def render(self, font, text, color):
+        return self.get((text, color, font), lambda: font.render(text, True, color))
+
+    def render_block(self, font, lines, color, line_height):
+        """把多行文字合成一张表面；内容不变时直接复用"""
+        lines = tuple(lines)
+
+        def build():
+            surfaces = [self.render(font, text, color) for text in lines]
+            width = max((surf.get_width() for surf in surfaces), default=0)
+            block = pygame.Surface((max(1, width), max(1, line_height * len(lines))), pygame.SRCALPHA)
+            for i, surf in enumerate(surfaces):
+                block.blit(surf, (0, i * line_height))
+            return block
+
+        return self.get((lines, color, font, line_height), build)
+
+
+text_cache = TextCache()
+
+INSTRUCTIONS = (
+    "空格键: 停止/继续, R: 重置, ESC: 退出, G: 显示/隐藏网络, F: 显示/隐藏力场",
+    "鼠标左键: 添加障碍物, 鼠标右键: 添加捕食者, V: 切换精灵/像素绘制, T/[/]: 开关/调整轨迹",
+    "上/下键: 调整分离权重, 左/右键: 调整聚合权重, P: 性能面板, O: 导出计时, F5/F9: 保存/读取快照",
+)
+
 def draw_text(screen, font, title_font):
     """绘制所有文本"""
-    title = title_font.render("Optimized Boids Model", True, HIGHLIGHT_COLOR)
-    screen.blit(title, (WIDTH//2 - title.get_width()//2, 20))
-    
-    instructions = [
-        "空格键: 停止/继续, R: 重置, ESC: 退出, G: 显示/隐藏网络, F: 显示/隐藏力场",
-        "鼠标左键: 添加障碍物, 鼠标右键: 添加捕食者",
-        "上/下键: 调整分离权重, 左/右键: 调整聚合权重",
-    ]
+    title = text_cache.render(title_font, "Optimized Boids Model", HIGHLIGHT_COLOR)
+    screen.blit(title, (screen.get_width()//2 - title.get_width()//2, 20))
     
-    for i, text in enumerate(instructions):
-        text_surf = font.render(text, True, TEXT_COLOR)
-        screen.blit(text_surf, (20, HEIGHT - 90 + i * 25))
+    # 操作说明只在第一次绘制时渲染成一张表面
+    instructions = text_cache.render_block(font, INSTRUCTIONS, TEXT_COLOR, 25)
+    screen.blit(instructions, (20, screen.get_height() - 90))
 
 def draw_stats(screen, font, boids, predators, obstacles, paused, params):
     """绘制统计数据和参数"""
     if paused:
-        pause_surf = font.render("PAUSED", True, HIGHLIGHT_COLOR)
-        screen.blit(pause_surf, (WIDTH // 2 - pause_surf.get_width() // 2, HEIGHT / 2))
+        pause_surf = text_cache.render(font, "PAUSED", HIGHLIGHT_COLOR)
+        screen.blit(pause_surf, (screen.get_width() // 2 - pause_surf.get_width() // 2,
+                                 screen.get_height() / 2))
         
-    stats = [
+    stats = (
         f"Boids数量: {len(boids)}",
         f"捕食者数量: {len(predators)}",
         f"障碍物数量: {len(obstacles)}",
@@ -42,72 +82,224 @@ def draw_stats(screen, font, boids, predators, obstacles, paused, params):
         f"碰撞规避: {params['separation_weight']:.1f}",
         f"群体中心定位: {params['cohesion_weight']:.1f}",
         f"速度匹配: {params['align_weight']:.1f}",
-    ]
+    )
     
-    for i, text in enumerate(stats):
-        text_surf = font.render(text, True, TEXT_COLOR)
-        screen.blit(text_surf, (WIDTH - 250, 20 + i * 25))
+    # 数值不变时复用上一次渲染的整块统计信息
+    screen.blit(text_cache.render_block(font, stats, TEXT_COLOR, 25), (screen.get_width() - 250, 20))
+
+def draw_profiler(screen, font, profiler):
+    """在统计数据下方绘制各阶段耗时的滚动分位数 (毫秒)"""
+    lines = ["--- 耗时 p50 / p95 / p99 (ms) ---"]
+    for name, _, _, p50, p95, p99 in profiler.summary():
+        lines.append(f"{name}: {p50:.2f} / {p95:.2f} / {p99:.2f}")
+
+    for i, text in enumerate(lines):
+        text_surf = text_cache.render(font, text, TEXT_COLOR)
+        screen.blit(text_surf, (screen.get_width() - 250, 200 + i * 22))
 
 def draw_grid(screen, grid):
     """绘制空间分区网格"""
-    for x in range(0, WIDTH, grid.cell_size):
-        pygame.draw.line(screen, GRID_COLOR, (x, 0), (x, HEIGHT))
-    for y in range(0, HEIGHT, grid.cell_size):
-        pygame.draw.line(screen, GRID_COLOR, (0, y), (WIDTH, y))
+    for i in range(grid.grid_width):
+        x = round(i * grid.cell_width)
+        pygame.draw.line(screen, GRID_COLOR, (x, 0), (x, screen.get_height()))
+    for i in range(grid.grid_height):
+        y = round(i * grid.cell_height)
+        pygame.draw.line(screen, GRID_COLOR, (0, y), (screen.get_width(), y))
+
+class VelocityField:
+    """把Boid速度一次性散射到粗网格上得到的速度场，用于力场可视化
+
+    采样点间距为 spacing，每只Boid计入离它最近的采样点，再用 (2*blur+1)^2
+    的环形方框核平滑。结果缓存 cache_frames 帧，期间只重绘缓存的线段。
+    """
+
+    def __init__(self, width=WIDTH, height=HEIGHT, spacing=FORCE_FIELD_SPACING,
+                 blur=FORCE_FIELD_BLUR, cache_frames=FORCE_FIELD_CACHE_FRAMES):
+        self.spacing = spacing
+        self.blur = blur
+        self.cache_frames = max(1, cache_frames)
+        self.grid_width = max(1, round(width / spacing))
+        self.grid_height = max(1, round(height / spacing))
+        self.segments = []
+        self._age = self.cache_frames
+
+    def compute(self, pos, vel):
+        """返回 (grid_height, grid_width, 2) 的速度和以及 (grid_height, grid_width) 的计数"""
+        gw, gh = self.grid_width, self.grid_height
+        bx = np.rint(pos[:, 0] / self.spacing).astype(np.intp) % gw
+        by = np.rint(pos[:, 1] / self.spacing).astype(np.intp) % gh
+        cells = by * gw + bx
+        size = gw * gh
+        total = np.empty((size, 2))
+        total[:, 0] = np.bincount(cells, weights=vel[:, 0], minlength=size)
+        total[:, 1] = np.bincount(cells, weights=vel[:, 1], minlength=size)
+        counts = np.bincount(cells, minlength=size).astype(float)
+        total = total.reshape(gh, gw, 2)
+        counts = counts.reshape(gh, gw)
+        if self.blur > 0:
+            total = self._box_blur(total)
+            counts = self._box_blur(counts)
+        return total, counts
 
-def draw_force_field(screen, boids):
+    def _box_blur(self, field):
+        # 世界首尾相接，按行、列分别做环形滑动求和
+        for axis in (0, 1):
+            summed = field.copy()
+            for shift in range(1, self.blur + 1):
+                summed += np.roll(field, shift, axis) + np.roll(field, -shift, axis)
+            field = summed
+        return field
+
+    def update(self, flock):
+        """缓存过期时重新计算要绘制的线段"""
+        self._age += 1
+        if self._age < self.cache_frames:
+            return
+        self._age = 0
+        total, counts = self.compute(flock.pos[:flock.n], flock.vel[:flock.n])
+        lengths = np.hypot(total[..., 0], total[..., 1])
+        ys, xs = np.nonzero((counts > 0) & (lengths > 0))
+        # 只关心平均速度的方向，速度和与平均值方向相同
+        direction = total[ys, xs] / lengths[ys, xs, None]
+        starts = np.column_stack((xs, ys)) * self.spacing
+        ends = starts + direction * 15
+        self.segments = list(zip(starts.tolist(), ends.tolist()))
+
+    def invalidate(self):
+        self._age = self.cache_frames
+
+
+def draw_force_field(screen, field, flock):
     """可视化Boid的速度场"""
-    for y in range(0, HEIGHT, 40):
-        for x in range(0, WIDTH, 40):
-            pos = Vector2(x, y)
-            avg_vel = Vector2()
-            count = 0
-            for boid in boids:
-                if pos.distance_to(boid.position) < 80:
-                    avg_vel += boid.velocity
-                    count += 1
-            if count > 0:
-                avg_vel /= count
-                if avg_vel.length() > 0:
-                    end_pos = pos + avg_vel.normalize() * 15
-                    pygame.draw.line(screen, FORCE_COLOR, pos, end_pos, 1)
+    field.update(flock)
+    for start, end in field.segments:
+        pygame.draw.line(screen, FORCE_COLOR, start, end, 1)
+
+def wrap_delta(delta, extent):
+    """把环形世界中的坐标差折算到 [-extent/2, extent/2] 范围内"""
+    # 绝大多数坐标差本来就在范围内，直接返回（结果与下面的公式相同）
+    if -extent / 2 <= delta <= extent / 2:
+        return delta
+    return delta - extent * round(delta / extent)
 
 class SpatialGrid:
-    """空间分区网格，用于优化邻居查找"""
+    """空间分区网格，用于优化邻居查找
+
+    世界首尾相接（与 Boid._wrap_around 一致），单元格下标和距离都按环形计算。
+    """
     def __init__(self, width, height, cell_size):
         self.width = width
         self.height = height
         self.cell_size = cell_size
-        self.grid_width = (width // cell_size) + 1
-        self.grid_height = (height // cell_size) + 1
+        self.grid_width = max(1, int(width // cell_size))
+        self.grid_height = max(1, int(height // cell_size))
+        # 单元格均分整个世界，边长不小于 cell_size
+        self.cell_width = width / self.grid_width
+        self.cell_height = height / self.grid_height
         self.clear()
 
     def clear(self):
         self.grid = [[] for _ in range(self.grid_width * self.grid_height)]
+        # 实体 -> [所在单元格下标, 在该单元格列表中的位置]
+        self._locations = {}
+        self.migrations = 0
+
+    def _get_cell_coords(self, position):
+        x = int((position.x % self.width) // self.cell_width) % self.grid_width
+        y = int((position.y % self.height) // self.cell_height) % self.grid_height
+        return x, y
 
     def _get_cell_index(self, position):
-        x = max(0, min(self.grid_width - 1, int(position.x // self.cell_size)))
-        y = max(0, min(self.grid_height - 1, int(position.y // self.cell_size)))
+        x, y = self._get_cell_coords(position)
         return y * self.grid_width + x
 
+    def _insert(self, entity, index):
+        cell = self.grid[index]
+        self._locations[entity] = [index, len(cell)]
+        cell.append(entity)
+
+    def _detach(self, entity, location):
+        """与单元格末尾元素交换后弹出，O(1) 删除"""
+        index, slot = location
+        cell = self.grid[index]
+        last = cell.pop()
+        if last is not entity:
+            cell[slot] = last
+            self._locations[last][1] = slot
+
     def add(self, entity):
+        if entity in self._locations:
+            self.update(entity)
+        else:
+            self._insert(entity, self._get_cell_index(entity.position))
+
+    def remove(self, entity):
+        self._detach(entity, self._locations.pop(entity))
+
+    def update(self, entity):
+        """实体移动后调用，只有跨越单元格时才迁移"""
         index = self._get_cell_index(entity.position)
-        self.grid[index].append(entity)
+        location = self._locations[entity]
+        if location[0] != index:
+            self._detach(entity, location)
+            self._insert(entity, index)
+            self.migrations += 1
+
+    def update_all(self, entities, positions=None):
+        """增量更新一帧中所有实体的位置，返回本帧的单元格迁移次数
+
+        positions 可以直接传入与 entities 对应的坐标数组，避免逐个读取 entity.position。
+        """
+        self.migrations = 0
+        if positions is None:
+            for entity in entities:
+                self.update(entity)
+            return self.migrations
+        locations = self._locations
+        for entity, (x, y) in zip(entities, positions):
+            index = (int((y % self.height) // self.cell_height) % self.grid_height * self.grid_width
+                     + int((x % self.width) // self.cell_width) % self.grid_width)
+            location = locations[entity]
+            if location[0] != index:
+                self._detach(entity, location)
+                self._insert(entity, index)
+                self.migrations += 1
+        return self.migrations
+
+    def _ring_cells(self, coord, center, rings, count, size, extent, radius):
+        """一个轴上需要检查的单元格及其到查询点的最小距离（超出半径的整列/整行直接剔除）"""
+        if 2 * rings + 1 >= count:
+            cells = range(count)
+        else:
+            cells = [(center + d) % count for d in range(-rings, rings + 1)]
+        result = []
+        for cell in cells:
+            gap = max(0.0, abs(wrap_delta(coord - (cell + 0.5) * size, extent)) - size / 2)
+            if gap < radius:
+                result.append((cell, gap * gap))
+        return result
 
     def get_neighbors(self, entity, radius):
         neighbors = []
-        center_x = int(entity.position.x // self.cell_size)
-        center_y = int(entity.position.y // self.cell_size)
-        
-        # 检查周围九个单元格（包括中心）
-        for dy in [-1, 0, 1]:
-            for dx in [-1, 0, 1]:
-                nx, ny = center_x + dx, center_y + dy
-                if 0 <= nx < self.grid_width and 0 <= ny < self.grid_height:
-                    index = ny * self.grid_width + nx
-                    for neighbor in self.grid[index]:
-                        if neighbor is not entity:
-                            dist_sq = entity.position.distance_squared_to(neighbor.position)
-                            if dist_sq < radius * radius:
-                                neighbors.append(neighbor)
-        return neighbors
\ No newline at end of file
+        px = entity.position.x
+        py = entity.position.y
+        center_x, center_y = self._get_cell_coords(entity.position)
+        radius_sq = radius * radius
+
+        # 覆盖 ceil(radius / cell_size) 圈单元格，按单元格到查询点的最小距离剔除
+        columns = self._ring_cells(px, center_x, math.ceil(radius / self.cell_width),
+                                   self.grid_width, self.cell_width, self.width, radius)
+        rows = self._ring_cells(py, center_y, math.ceil(radius / self.cell_height),
+                                self.grid_height, self.cell_height, self.height, radius)
+        for ny, gap_y_sq in rows:
+            for nx, gap_x_sq in columns:
+                if gap_x_sq + gap_y_sq >= radius_sq:
+                    continue
+                for neighbor in self.grid[ny * self.grid_width + nx]:
+                    if neighbor is not entity:
+                        pos = neighbor.position
+                        dx = wrap_delta(pos.x - px, self.width)
+                        dy = wrap_delta(pos.y - py, self.height)
+                        if dx * dx + dy * dy < radius_sq:
+                            neighbors.append(neighbor)
+        return neighbors